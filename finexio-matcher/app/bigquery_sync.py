@@ -1,52 +1,98 @@
 """BigQuery synchronization for importing Finexio supplier data."""
 
 import os
+import io
+import csv
 import json
 from datetime import datetime
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Tuple
 import structlog
-from google.cloud import bigquery
+from pgvector import HalfVector
+from google.cloud import bigquery, bigquery_storage
 from google.oauth2 import service_account
 
 from app.config import settings
 from app.db import get_db
-from app.canonicalize import canonicalize
-from app.utils import get_embedding
+from app.canonicalize import canonicalize_batch
+from app.features import invalidate_payee_cache
+from app.utils import get_embeddings
 from sqlalchemy import text
 
 logger = structlog.get_logger()
 
 
-def get_bigquery_client():
-    """Get BigQuery client with credentials."""
-    if not settings.bigquery_project_id:
-        raise ValueError("BigQuery project ID not configured")
-    
+# Columns read from BigQuery, mapped to their payee field names
+BQ_COLUMNS = {
+    "supplier_id": "bq_supplier_id",
+    "supplier_name": "name_raw",
+    "address": "address",
+    "city": "city",
+    "state": "state",
+    "zip": "zip_code",
+    "country": "country"
+}
+
+
+def get_bigquery_credentials():
+    """Get service account credentials, or None to use the defaults."""
     if settings.bigquery_credentials and os.path.exists(settings.bigquery_credentials):
         # Load credentials from file
-        credentials = service_account.Credentials.from_service_account_file(
+        return service_account.Credentials.from_service_account_file(
             settings.bigquery_credentials
         )
-        client = bigquery.Client(
-            project=settings.bigquery_project_id,
-            credentials=credentials
-        )
-    else:
-        # Use default credentials (for Replit environment)
-        client = bigquery.Client(project=settings.bigquery_project_id)
     
-    return client
+    # Use default credentials (for Replit environment)
+    return None
+
+
+def get_bigquery_client():
+    """Get BigQuery client with credentials."""
+    if not settings.bigquery_project_id:
+        raise ValueError("BigQuery project ID not configured")
+    
+    return bigquery.Client(
+        project=settings.bigquery_project_id,
+        credentials=get_bigquery_credentials()
+    )
+
 
+def get_bigquery_storage_client():
+    """Get BigQuery Storage read client for streaming results as Arrow."""
+    return bigquery_storage.BigQueryReadClient(
+        credentials=get_bigquery_credentials()
+    )
 
-def sync_suppliers_from_bigquery(batch_size: int = 1000, limit: int = None):
+
+def sync_suppliers_from_bigquery(
+    batch_size: int = 1000,
+    limit: int = None,
+    copy_path: bool = False
+):
     """
     Sync suppliers from BigQuery to PostgreSQL.
     
     Args:
         batch_size: Number of records to process at once
         limit: Maximum number of records to sync (None for all)
+        copy_path: Load batches of COPY_MIN_ROWS or more via COPY
+            (best for full reloads)
     """
-    logger.info("starting_bigquery_sync", batch_size=batch_size, limit=limit)
+    logger.info(
+        "starting_bigquery_sync",
+        batch_size=batch_size,
+        limit=limit,
+        copy_path=copy_path
+    )
+    
+    def load_batch(db, batch):
+        try:
+            if copy_path and len(batch) >= COPY_MIN_ROWS:
+                return copy_supplier_batch(db, batch)
+            return process_supplier_batch(db, batch)
+        finally:
+            # Each batch commits on its own, so drop cached payee records as
+            # soon as it lands (or partly lands) rather than after the sync
+            invalidate_payee_cache()
     
     try:
         client = get_bigquery_client()
@@ -56,13 +102,7 @@ def sync_suppliers_from_bigquery(batch_size: int = 1000, limit: int = None):
         
         query = f"""
         SELECT 
-            supplier_id,
-            supplier_name,
-            address,
-            city,
-            state,
-            zip,
-            country
+            {", ".join(BQ_COLUMNS)}
         FROM `{table_ref}`
         WHERE supplier_name IS NOT NULL
         """
@@ -72,9 +112,13 @@ def sync_suppliers_from_bigquery(batch_size: int = 1000, limit: int = None):
         
         logger.info("executing_bigquery_query", table=table_ref)
         
-        # Execute query
+        # Execute query and stream results as Arrow record batches over
+        # the Storage API instead of paging JSON rows through REST
         query_job = client.query(query)
-        results = query_job.result()
+        arrow_batches = query_job.result().to_arrow_iterable(
+            bqstorage_client=get_bigquery_storage_client(),
+            max_queue_size=4
+        )
         
         # Process in batches
         batch = []
@@ -83,37 +127,33 @@ def sync_suppliers_from_bigquery(batch_size: int = 1000, limit: int = None):
         total_updated = 0
         
         with get_db() as db:
-            for row in results:
-                supplier = {
-                    "bq_supplier_id": row.supplier_id,
-                    "name_raw": row.supplier_name,
-                    "address": row.address,
-                    "city": row.city,
-                    "state": row.state,
-                    "zip_code": row.zip,
-                    "country": row.country
-                }
-                
-                batch.append(supplier)
+            for arrow_batch in arrow_batches:
+                columns = [
+                    (field, arrow_batch.column(column).to_pylist())
+                    for column, field in BQ_COLUMNS.items()
+                ]
                 
-                if len(batch) >= batch_size:
-                    inserted, updated = process_supplier_batch(db, batch)
-                    total_inserted += inserted
-                    total_updated += updated
-                    total_processed += len(batch)
+                for i in range(arrow_batch.num_rows):
+                    batch.append({field: values[i] for field, values in columns})
                     
-                    logger.info(
-                        "batch_processed",
-                        processed=total_processed,
-                        inserted=total_inserted,
-                        updated=total_updated
-                    )
-                    
-                    batch = []
+                    if len(batch) >= batch_size:
+                        inserted, updated = load_batch(db, batch)
+                        total_inserted += inserted
+                        total_updated += updated
+                        total_processed += len(batch)
+                        
+                        logger.info(
+                            "batch_processed",
+                            processed=total_processed,
+                            inserted=total_inserted,
+                            updated=total_updated
+                        )
+                        
+                        batch = []
             
             # Process remaining batch
             if batch:
-                inserted, updated = process_supplier_batch(db, batch)
+                inserted, updated = load_batch(db, batch)
                 total_inserted += inserted
                 total_updated += updated
                 total_processed += len(batch)
@@ -136,153 +176,305 @@ def sync_suppliers_from_bigquery(batch_size: int = 1000, limit: int = None):
         raise
 
 
-def process_supplier_batch(db, suppliers: List[Dict[str, Any]]) -> Tuple[int, int]:
+# Batches at least this large go through COPY when copy_path is enabled
+COPY_MIN_ROWS = 1024
+
+# Session-local staging table for COPY loads; rows vanish on commit
+STAGING_TABLE_SQL = """
+    CREATE TEMP TABLE IF NOT EXISTS payees_staging (
+        bq_supplier_id TEXT,
+        name_raw       TEXT,
+        name_canon     TEXT,
+        name_tokens    TEXT[],
+        dm_codes       TEXT[],
+        name_vec       HALFVEC,
+        address        TEXT,
+        city           TEXT,
+        state          TEXT,
+        zip_code       TEXT,
+        country        TEXT,
+        bq_sync_date   TIMESTAMPTZ
+    ) ON COMMIT DELETE ROWS
+"""
+
+# Columns written by the supplier upsert, in VALUES order
+UPSERT_COLUMNS = [
+    "bq_supplier_id", "name_raw", "name_canon", "name_tokens", "dm_codes",
+    "name_vec", "address", "city", "state", "zip_code", "country", "bq_sync_date"
+]
+
+
+def build_upsert_sql(row_count: int, include_vec: bool) -> str:
+    """
+    Build a multi-row INSERT ... ON CONFLICT upsert for payees.
+    
+    Every row gets its own numbered bind parameters so the whole batch goes
+    to Postgres as one statement, and RETURNING reports insert vs update.
+    """
+    columns = [c for c in UPSERT_COLUMNS if include_vec or c != "name_vec"]
+    
+    rows = []
+    for i in range(row_count):
+        values = []
+        for column in columns:
+            if column == "name_vec":
+                values.append(f"CAST(:name_vec_{i} AS halfvec)")
+            else:
+                values.append(f":{column}_{i}")
+        rows.append(f"({', '.join(values)})")
+    
+    updates = [
+        f"{column} = EXCLUDED.{column}"
+        for column in columns if column != "bq_supplier_id"
+    ]
+    updates.append("updated_at = NOW()")
+    
+    return f"""
+        INSERT INTO payees ({', '.join(columns)})
+        VALUES {', '.join(rows)}
+        ON CONFLICT (bq_supplier_id) DO UPDATE
+        SET {', '.join(updates)}
+        RETURNING (xmax = 0) AS inserted
+    """
+
+
+def build_supplier_rows(
+    suppliers: List[Dict[str, Any]],
+    include_vec: bool
+) -> List[Dict[str, Any]]:
+    """
+    Canonicalize (and optionally embed) suppliers into payee rows.
+    
+    Returns:
+        List of payee rows. Only the last occurrence of a bq_supplier_id is
+        kept, since ON CONFLICT cannot touch the same row twice within one
+        statement; suppliers without an ID never conflict and are all kept.
+    """
+    sync_date = datetime.utcnow()
+    
+    # Canonicalize names as one vectorized batch
+    canonicalized = list(zip(
+        suppliers,
+        canonicalize_batch([supplier["name_raw"] for supplier in suppliers])
+    ))
+    
+    # Get embeddings for the whole batch if enabled
+    embeddings = None
+    if include_vec:
+        embeddings = get_embeddings([c.canon for _, c in canonicalized])
+    
+    rows_by_id = {}
+    unkeyed_rows = []
+    for i, (supplier, canon_data) in enumerate(canonicalized):
+        row = {
+            "bq_supplier_id": supplier["bq_supplier_id"],
+            "name_raw": supplier["name_raw"],
+            "name_canon": canon_data.canon,
+            "name_tokens": list(canon_data.tokens),
+            "dm_codes": list(canon_data.dm_codes),
+            "address": supplier.get("address"),
+            "city": supplier.get("city"),
+            "state": supplier.get("state"),
+            "zip_code": supplier.get("zip_code"),
+            "country": supplier.get("country"),
+            "bq_sync_date": sync_date
+        }
+        
+        if embeddings is not None:
+            row["name_vec"] = HalfVector(embeddings[i])
+        
+        if supplier["bq_supplier_id"] is not None:
+            rows_by_id[supplier["bq_supplier_id"]] = row
+        else:
+            unkeyed_rows.append(row)
+    
+    return list(rows_by_id.values()) + unkeyed_rows
+
+
+def upsert_supplier_rows_individually(
+    db,
+    rows: List[Dict[str, Any]],
+    include_vec: bool
+) -> Tuple[int, int]:
     """
-    Process a batch of suppliers.
+    Upsert payee rows one at a time, each under its own savepoint.
+    
+    Used when a batch statement fails, so one bad supplier only loses its
+    own row instead of the whole batch.
     
     Returns:
         Tuple of (inserted_count, updated_count)
     """
+    upsert = text(build_upsert_sql(1, include_vec))
     inserted = 0
     updated = 0
+    failed_ids = []
+    last_error = None
     
-    for supplier in suppliers:
+    for row in rows:
         try:
-            # Canonicalize name
-            canon_data = canonicalize(supplier["name_raw"])
-            
-            # Get embedding if enabled
-            embedding = None
-            if settings.embeddings_provider != "none":
-                embedding = get_embedding(canon_data["canon"])
-            
-            # Check if exists
-            existing = db.execute(
-                text("""
-                    SELECT payee_id 
-                    FROM payees 
-                    WHERE bq_supplier_id = :bq_id
-                """),
-                {"bq_id": supplier["bq_supplier_id"]}
-            ).first()
-            
-            if existing:
-                # Update existing
-                params = {
-                    "payee_id": existing[0],
-                    "name_raw": supplier["name_raw"],
-                    "name_canon": canon_data["canon"],
-                    "name_tokens": canon_data["tokens"],
-                    "dm_codes": canon_data["dm_codes"],
-                    "address": supplier.get("address"),
-                    "city": supplier.get("city"),
-                    "state": supplier.get("state"),
-                    "zip_code": supplier.get("zip_code"),
-                    "country": supplier.get("country"),
-                    "bq_sync_date": datetime.utcnow()
-                }
-                
-                if embedding is not None:
-                    params["name_vec"] = f"[{','.join(map(str, embedding.tolist()))}]"
-                    
-                    db.execute(
-                        text("""
-                            UPDATE payees
-                            SET name_raw = :name_raw,
-                                name_canon = :name_canon,
-                                name_tokens = :name_tokens,
-                                dm_codes = :dm_codes,
-                                name_vec = :name_vec::vector,
-                                address = :address,
-                                city = :city,
-                                state = :state,
-                                zip_code = :zip_code,
-                                country = :country,
-                                bq_sync_date = :bq_sync_date,
-                                updated_at = NOW()
-                            WHERE payee_id = :payee_id
-                        """),
-                        params
-                    )
-                else:
-                    db.execute(
-                        text("""
-                            UPDATE payees
-                            SET name_raw = :name_raw,
-                                name_canon = :name_canon,
-                                name_tokens = :name_tokens,
-                                dm_codes = :dm_codes,
-                                address = :address,
-                                city = :city,
-                                state = :state,
-                                zip_code = :zip_code,
-                                country = :country,
-                                bq_sync_date = :bq_sync_date,
-                                updated_at = NOW()
-                            WHERE payee_id = :payee_id
-                        """),
-                        params
-                    )
-                
-                updated += 1
-            else:
-                # Insert new
-                params = {
-                    "bq_supplier_id": supplier["bq_supplier_id"],
-                    "name_raw": supplier["name_raw"],
-                    "name_canon": canon_data["canon"],
-                    "name_tokens": canon_data["tokens"],
-                    "dm_codes": canon_data["dm_codes"],
-                    "address": supplier.get("address"),
-                    "city": supplier.get("city"),
-                    "state": supplier.get("state"),
-                    "zip_code": supplier.get("zip_code"),
-                    "country": supplier.get("country"),
-                    "bq_sync_date": datetime.utcnow()
-                }
-                
-                if embedding is not None:
-                    params["name_vec"] = f"[{','.join(map(str, embedding.tolist()))}]"
-                    
-                    db.execute(
-                        text("""
-                            INSERT INTO payees 
-                            (bq_supplier_id, name_raw, name_canon, name_tokens, dm_codes, 
-                             name_vec, address, city, state, zip_code, country, bq_sync_date)
-                            VALUES 
-                            (:bq_supplier_id, :name_raw, :name_canon, :name_tokens, :dm_codes,
-                             :name_vec::vector, :address, :city, :state, :zip_code, :country, :bq_sync_date)
-                        """),
-                        params
-                    )
-                else:
-                    db.execute(
-                        text("""
-                            INSERT INTO payees 
-                            (bq_supplier_id, name_raw, name_canon, name_tokens, dm_codes,
-                             address, city, state, zip_code, country, bq_sync_date)
-                            VALUES 
-                            (:bq_supplier_id, :name_raw, :name_canon, :name_tokens, :dm_codes,
-                             :address, :city, :state, :zip_code, :country, :bq_sync_date)
-                        """),
-                        params
-                    )
-                
-                inserted += 1
-                
+            with db.begin_nested():
+                is_insert = db.execute(
+                    upsert,
+                    {f"{column}_0": value for column, value in row.items()}
+                ).scalar()
         except Exception as e:
-            logger.error(
-                "supplier_process_failed",
-                supplier_id=supplier.get("bq_supplier_id"),
-                error=str(e)
-            )
+            failed_ids.append(row["bq_supplier_id"])
+            last_error = str(e)
+            continue
+        
+        if is_insert:
+            inserted += 1
+        else:
+            updated += 1
     
-    # Commit the batch
     db.commit()
     
+    if failed_ids:
+        logger.error(
+            "supplier_rows_failed",
+            count=len(failed_ids),
+            bq_supplier_ids=failed_ids,
+            error=last_error
+        )
+    
+    return inserted, updated
+
+
+def upsert_supplier_rows(
+    db,
+    rows: List[Dict[str, Any]],
+    include_vec: bool
+) -> Tuple[int, int]:
+    """
+    Upsert payee rows with a single statement, retrying row by row on failure.
+    
+    Returns:
+        Tuple of (inserted_count, updated_count)
+    """
+    params = {}
+    for i, row in enumerate(rows):
+        for column, value in row.items():
+            params[f"{column}_{i}"] = value
+    
+    try:
+        result = db.execute(
+            text(build_upsert_sql(len(rows), include_vec)),
+            params
+        ).fetchall()
+        
+        # Commit the batch
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        logger.error("supplier_batch_failed", size=len(rows), error=str(e))
+        return upsert_supplier_rows_individually(db, rows, include_vec)
+    
+    inserted = sum(1 for row in result if row[0])
+    updated = len(result) - inserted
+    
     return inserted, updated
 
 
+def process_supplier_batch(db, suppliers: List[Dict[str, Any]]) -> Tuple[int, int]:
+    """
+    Process a batch of suppliers with a single upsert statement.
+    
+    Returns:
+        Tuple of (inserted_count, updated_count)
+    """
+    include_vec = settings.embeddings_provider != "none"
+    rows = build_supplier_rows(suppliers, include_vec)
+    
+    if not rows:
+        return 0, 0
+    
+    return upsert_supplier_rows(db, rows, include_vec)
+
+
+def format_copy_value(value: Any) -> Any:
+    """Format a row value for a CSV COPY stream."""
+    if isinstance(value, list):
+        # Quote every element so tokens like "null" stay literal strings,
+        # escaping the characters that are special inside a quoted element
+        return "{" + ",".join(
+            '"' + str(item).replace("\\", "\\\\").replace('"', '\\"') + '"'
+            for item in value
+        ) + "}"
+    if isinstance(value, HalfVector):
+        return value.to_text()
+    return value
+
+
+def copy_supplier_batch(db, suppliers: List[Dict[str, Any]]) -> Tuple[int, int]:
+    """
+    Load a batch of suppliers via COPY into a staging table, then merge.
+    
+    COPY streams the whole batch in one go without per-row parse/plan
+    overhead, which pays off for large reloads.
+    
+    Returns:
+        Tuple of (inserted_count, updated_count)
+    """
+    include_vec = settings.embeddings_provider != "none"
+    rows = build_supplier_rows(suppliers, include_vec)
+    
+    if not rows:
+        return 0, 0
+    
+    columns = [c for c in UPSERT_COLUMNS if include_vec or c != "name_vec"]
+    column_list = ", ".join(columns)
+    updates = [
+        f"{column} = EXCLUDED.{column}"
+        for column in columns if column != "bq_supplier_id"
+    ]
+    updates.append("updated_at = NOW()")
+    
+    # Render the batch as CSV
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow([format_copy_value(row[column]) for column in columns])
+    buffer.seek(0)
+    
+    try:
+        raw_conn = db.connection().connection
+        with raw_conn.cursor() as cur:
+            cur.execute(STAGING_TABLE_SQL)
+            cur.copy_expert(
+                # csv writes "" as a bare empty field, which COPY reads as
+                # NULL; names that canonicalize to "" must stay empty strings
+                f"COPY payees_staging ({column_list}) FROM STDIN "
+                f"WITH (FORMAT csv, FORCE_NOT_NULL (name_raw, name_canon))",
+                buffer
+            )
+        
+        result = db.execute(
+            text(f"""
+                WITH merged AS (
+                    INSERT INTO payees ({column_list})
+                    SELECT {column_list} FROM payees_staging
+                    ON CONFLICT (bq_supplier_id) DO UPDATE
+                    SET {', '.join(updates)}
+                    RETURNING (xmax = 0) AS inserted
+                )
+                SELECT
+                    COUNT(*) FILTER (WHERE inserted),
+                    COUNT(*) FILTER (WHERE NOT inserted)
+                FROM merged
+            """)
+        ).first()
+        
+        # Commit the batch (also clears the staging table)
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        logger.error("supplier_copy_failed", size=len(rows), error=str(e))
+        return upsert_supplier_rows(db, rows, include_vec)
+    
+    return result[0], result[1]
+
+
 def get_supplier_count() -> int:
     """Get count of suppliers in database."""
     with get_db() as db:
@@ -1,17 +1,24 @@
 """Candidate generation using multiple complementary views."""
 
-from typing import List, Tuple, Dict, Any
+from functools import lru_cache
+from typing import List, Tuple, Dict, Any, Optional
 import numpy as np
 from sqlalchemy import text
 from sqlalchemy.orm import Session
 import structlog
+from pgvector import HalfVector
 
 from app.config import settings
-from app.utils import get_embedding, cosine_similarity
-from app.canonicalize import canonicalize
+from app.db import ensure_prepared
+from app.utils import get_embedding
+from app.canonicalize import canonicalize, CanonResult
 
 logger = structlog.get_logger()
 
+# Candidate "scores" hold one score per generation method, in this order
+SCORE_SOURCES = ("trgm", "vec", "dm")
+_SOURCE_INDEX = {source: i for i, source in enumerate(SCORE_SOURCES)}
+
 
 def get_trigram_candidates(
     db: Session, 
@@ -74,21 +81,18 @@ def get_vector_candidates(
         return []
     
     try:
-        # Convert numpy array to PostgreSQL array format
-        vec_str = f"[{','.join(map(str, query_vec.tolist()))}]"
-        
         result = db.execute(
             text("""
                 SELECT 
                     payee_id,
                     name_canon,
-                    1 - (name_vec <=> :query_vec::vector) AS cos_sim
+                    1 - (name_vec <=> CAST(:query_vec AS halfvec)) AS cos_sim
                 FROM payees
                 WHERE name_vec IS NOT NULL
-                ORDER BY name_vec <=> :query_vec::vector
+                ORDER BY name_vec <=> CAST(:query_vec AS halfvec)
                 LIMIT :limit
             """),
-            {"query_vec": vec_str, "limit": limit}
+            {"query_vec": HalfVector(query_vec), "limit": limit}
         ).fetchall()
         
         candidates = [
@@ -106,7 +110,7 @@ def get_vector_candidates(
 
 def get_phonetic_candidates(
     db: Session,
-    query_data: Dict[str, Any],
+    query_data: CanonResult,
     limit: int = None
 ) -> List[Tuple[int, float, str]]:
     """
@@ -116,53 +120,31 @@ def get_phonetic_candidates(
         List of (payee_id, score, source) tuples
     """
     limit = limit or settings.topk_phonetic
-    dm_codes = query_data.get("dm_codes", [])
+    dm_codes = list(query_data.dm_codes)
     
     if not dm_codes:
         return []
     
     try:
-        # Get candidates with overlapping phonetic codes
+        # Look up each code through the GIN index and count the hits per
+        # payee; codes are distinct, so Jaccard = hits / (|a| + |b| - hits)
         result = db.execute(
             text("""
                 SELECT 
-                    payee_id,
-                    name_canon,
-                    dm_codes,
-                    array_length(
-                        ARRAY(
-                            SELECT unnest(dm_codes) 
-                            INTERSECT 
-                            SELECT unnest(:codes::text[])
-                        ), 1
-                    ) AS overlap_count
-                FROM payees
-                WHERE dm_codes && :codes::text[]  -- Has overlap
-                ORDER BY overlap_count DESC NULLS LAST
+                    p.payee_id,
+                    p.name_canon,
+                    COUNT(*)::float
+                        / (cardinality(p.dm_codes) + :num_codes - COUNT(*)) AS jaccard
+                FROM unnest(CAST(:codes AS text[])) AS q(code)
+                JOIN payees p ON p.dm_codes @> ARRAY[q.code]
+                GROUP BY p.payee_id
+                ORDER BY jaccard DESC
                 LIMIT :limit
             """),
-            {"codes": dm_codes, "limit": limit}
+            {"codes": dm_codes, "num_codes": len(dm_codes), "limit": limit}
         ).fetchall()
         
-        candidates = []
-        for row in result:
-            if row[3]:  # overlap_count
-                # Calculate Jaccard similarity
-                payee_codes = set(row[2]) if row[2] else set()
-                query_codes = set(dm_codes)
-                
-                if payee_codes and query_codes:
-                    intersection = len(payee_codes & query_codes)
-                    union = len(payee_codes | query_codes)
-                    jaccard = intersection / union if union > 0 else 0
-                    
-                    candidates.append(
-                        (row[0], jaccard, f"dm:{jaccard:.3f}")
-                    )
-        
-        # Sort by score and limit
-        candidates.sort(key=lambda x: x[1], reverse=True)
-        candidates = candidates[:limit]
+        candidates = [(row[0], row[2], f"dm:{row[2]:.3f}") for row in result]
         
         logger.debug("phonetic_candidates", count=len(candidates))
         return candidates
@@ -203,6 +185,126 @@ def get_exact_match(
         return []
 
 
+# Views of the fused candidate query. Every variant is prepared with the same
+# parameter list: $1 query canon, $2 k_trgm, $3 query vec, $4 k_vec,
+# $5 dm codes, $6 k_dm
+CANDIDATE_CTES = {
+    "trgm": """
+        trgm AS (
+            SELECT payee_id, similarity(name_canon, $1) AS score, 'trgm' AS src
+            FROM payees
+            WHERE name_canon % $1  -- Uses trigram index
+            ORDER BY score DESC
+            LIMIT $2
+        )
+    """,
+    "vec": """
+        vec AS (
+            SELECT payee_id, 1 - (name_vec <=> $3) AS score, 'vec' AS src
+            FROM payees
+            WHERE name_vec IS NOT NULL
+            ORDER BY name_vec <=> $3
+            LIMIT $4
+        )
+    """,
+    "dm": """
+        dm AS (
+            SELECT
+                p.payee_id,
+                COUNT(*)::float
+                    / (cardinality(p.dm_codes) + cardinality($5) - COUNT(*)) AS score,
+                'dm' AS src
+            FROM unnest($5) AS q(code)
+            JOIN payees p ON p.dm_codes @> ARRAY[q.code]  -- GIN lookup per code
+            GROUP BY p.payee_id
+            ORDER BY score DESC
+            LIMIT $6
+        )
+    """
+}
+CANDIDATE_PARAM_TYPES = "text, int, halfvec, int, text[], int"
+
+
+@lru_cache(maxsize=None)
+def candidate_statement(sources: Tuple[str, ...]) -> Tuple[str, str]:
+    """
+    Build the prepared statement for a combination of candidate views.
+    
+    Returns:
+        Tuple of (statement_name, prepare_sql)
+    """
+    name = "candidates_" + "_".join(sources)
+    query = (
+        "WITH " + ",".join(CANDIDATE_CTES[source] for source in sources) + " "
+        + " UNION ALL ".join(f"SELECT payee_id, score, src FROM {source}" for source in sources)
+    )
+    return name, f"PREPARE {name} ({CANDIDATE_PARAM_TYPES}) AS {query}"
+
+
+def get_all_candidates(
+    db: Session,
+    query_canon: str,
+    query_vec: Optional[np.ndarray] = None,
+    dm_codes: Tuple[str, ...] = ()
+) -> List[List[Tuple[int, float, str]]]:
+    """
+    Get trigram, vector and phonetic candidates with a single query.
+    
+    Each method is a CTE and the results are combined with UNION ALL, so
+    one round trip replaces three. Vector and phonetic views are skipped
+    when there is no query vector or no phonetic codes.
+    
+    The statement is prepared once per pooled connection, so repeat
+    matches skip parsing and planning.
+    
+    Returns:
+        List of non-empty (payee_id, score, source) lists, one per method
+    """
+    sources = ["trgm"]
+    params = {
+        "query": query_canon,
+        "k_trgm": settings.topk_trigram,
+        "query_vec": None,
+        "k_vec": None,
+        "codes": None,
+        "k_dm": None
+    }
+    
+    if query_vec is not None and query_vec.size > 0:
+        sources.append("vec")
+        params["query_vec"] = HalfVector(query_vec)
+        params["k_vec"] = settings.topk_vector
+    
+    if dm_codes:
+        sources.append("dm")
+        params["codes"] = list(dm_codes)
+        params["k_dm"] = settings.topk_phonetic
+    
+    name, prepare_sql = candidate_statement(tuple(sources))
+    
+    try:
+        ensure_prepared(db, name, prepare_sql)
+        
+        result = db.execute(
+            text(f"EXECUTE {name} (:query, :k_trgm, :query_vec, :k_vec, :codes, :k_dm)"),
+            params
+        ).fetchall()
+    except Exception as e:
+        logger.error("all_candidates_failed", error=str(e))
+        return []
+    
+    by_source = {source: [] for source in sources}
+    for payee_id, score, src in result:
+        by_source[src].append((payee_id, score, f"{src}:{score:.3f}"))
+    
+    logger.debug(
+        "all_candidates",
+        **{f"{source}_count": len(c) for source, c in by_source.items()}
+    )
+    
+    return [c for c in by_source.values() if c]
+
+
 def union_candidates(
     candidates_lists: List[List[Tuple[int, float, str]]],
     k_union: int = None
@@ -215,40 +317,50 @@ def union_candidates(
     """
     k_union = k_union or settings.k_union
     
-    # Aggregate by payee_id
+    rows = [row for candidates in candidates_lists for row in candidates]
+    if not rows:
+        return []
+    
+    # Group rows by payee_id with numpy (each source lists a payee once)
+    ids = np.array([row[0] for row in rows])
+    scores = np.array([row[1] for row in rows], dtype=float)
+    uniq, first_seen, inv = np.unique(ids, return_index=True, return_inverse=True)
+    
+    max_scores = np.full(len(uniq), -np.inf)
+    np.maximum.at(max_scores, inv, scores)
+    counts = np.bincount(inv)
+    avg_scores = np.bincount(inv, weights=scores) / counts
+    
+    # Sort by max score, then number of sources, ties in first-seen order
+    order = np.lexsort((first_seen, -counts, -max_scores))[:k_union]
+    
+    # Per-method scores (0 where a method didn't return the payee)
+    score_table = np.zeros((len(uniq), len(SCORE_SOURCES)))
+    src_idx = [_SOURCE_INDEX[row[2].split(":")[0]] for row in rows]
+    score_table[inv, src_idx] = scores
+    
+    # Only build dicts for the top K
     payee_scores = {}
+    for i in order.tolist():
+        payee_scores[uniq[i].item()] = {
+            "payee_id": uniq[i].item(),
+            "scores": tuple(score_table[i].tolist()),
+            "sources": [],
+            "max_score": max_scores[i].item(),
+            "avg_score": avg_scores[i].item(),
+            "num_sources": counts[i].item()
+        }
     
-    for candidates in candidates_lists:
-        for payee_id, score, source in candidates:
-            if payee_id not in payee_scores:
-                payee_scores[payee_id] = {
-                    "payee_id": payee_id,
-                    "scores": {},
-                    "sources": []
-                }
-            
-            # Extract source type and score
-            source_type = source.split(":")[0]
-            payee_scores[payee_id]["scores"][source_type] = score
-            payee_scores[payee_id]["sources"].append(source)
-    
-    # Calculate aggregate score (max of normalized scores)
-    for payee_data in payee_scores.values():
-        scores = list(payee_data["scores"].values())
-        payee_data["max_score"] = max(scores) if scores else 0
-        payee_data["avg_score"] = sum(scores) / len(scores) if scores else 0
-        payee_data["num_sources"] = len(scores)
-    
-    # Sort by max score and return top K
-    candidates = sorted(
-        payee_scores.values(),
-        key=lambda x: (x["max_score"], x["num_sources"]),
-        reverse=True
-    )[:k_union]
+    for payee_id, _, source in rows:
+        payee_data = payee_scores.get(payee_id)
+        if payee_data is not None:
+            payee_data["sources"].append(source)
+    
+    candidates = list(payee_scores.values())
     
     logger.info(
         "candidates_union",
-        total_unique=len(payee_scores),
+        total_unique=len(uniq),
         returned=len(candidates)
     )
     
@@ -257,17 +369,24 @@ def union_candidates(
 
 def get_candidates(
     db: Session,
-    query_name: str
+    query_name: str,
+    query_data: CanonResult = None
 ) -> List[Dict[str, Any]]:
     """
     Get all candidates for a query name using multiple methods.
     
+    Args:
+        db: Database session
+        query_name: Raw query name
+        query_data: Canonicalized query, if the caller already has it
+    
     Returns:
         List of candidate dictionaries with scores and metadata
     """
     # Canonicalize query
-    query_data = canonicalize(query_name)
-    query_canon = query_data["canon"]
+    if query_data is None:
+        query_data = canonicalize(query_name)
+    query_canon = query_data.canon
     
     if not query_canon:
         return []
@@ -277,31 +396,25 @@ def get_candidates(
     if exact:
         return [{
             "payee_id": exact[0][0],
-            "scores": {"exact": 1.0},
+            "scores": (0.0,) * len(SCORE_SOURCES),
             "sources": [exact[0][2]],
             "max_score": 1.0,
             "avg_score": 1.0,
             "num_sources": 1
         }]
     
-    # Get candidates from each method
-    candidates_lists = []
-    
-    # Trigram candidates
-    trigram = get_trigram_candidates(db, query_canon)
-    if trigram:
-        candidates_lists.append(trigram)
-    
-    # Vector candidates (if embeddings enabled)
+    # Vector candidates only if embeddings enabled
+    query_vec = None
     if settings.embeddings_provider != "none":
-        vector = get_vector_candidates(db, query_canon)
-        if vector:
-            candidates_lists.append(vector)
-    
-    # Phonetic candidates
-    phonetic = get_phonetic_candidates(db, query_data)
-    if phonetic:
-        candidates_lists.append(phonetic)
+        query_vec = get_embedding(query_canon)
+    
+    # Get candidates from all methods in one round trip
+    candidates_lists = get_all_candidates(
+        db,
+        query_canon,
+        query_vec,
+        query_data.dm_codes
+    )
     
     # Union and deduplicate
     return union_candidates(candidates_lists)
\ No newline at end of file
@@ -1,22 +1,25 @@
 """Canonicalization rules for payee name normalization."""
 
 import re
+import sys
 import unicodedata
-from typing import Dict, List, Set
+from functools import lru_cache
+from typing import Dict, List, NamedTuple, Set, Tuple
+import pandas as pd
 from metaphone import doublemetaphone
 import structlog
 
 logger = structlog.get_logger()
 
 # Generic words to remove
-GENERIC_WORDS = {
+GENERIC_WORDS = frozenset({
     'the', 'of', 'and', 'group', 'company', 'services', 
     'holdings', 'solutions', 'global', 'international',
     'enterprises', 'partners', 'associates', 'consulting'
-}
+})
 
 # Corporate suffixes to remove (comprehensive list)
-CORPORATE_SUFFIXES = {
+CORPORATE_SUFFIXES = frozenset({
     # US/UK
     'co', 'inc', 'incorporated', 'llc', 'l.l.c', 'llp', 'ltd', 'limited',
     'corp', 'corporation', 'plc', 'p.l.c', 'lp', 'l.p',
@@ -29,7 +32,7 @@ CORPORATE_SUFFIXES = {
     # Other
     'pty ltd', 'pvt ltd', 'private limited', 'public limited',
     'limitada', 'ltda', 'sl', 's.l.', 'cv', 'c.v.', 'de cv'
-}
+})
 
 # Common abbreviations to expand
 ABBREVIATIONS = {
@@ -46,28 +49,61 @@ ABBREVIATIONS = {
 }
 
 
+class CanonResult(NamedTuple):
+    """Immutable canonicalization result (safe to share from the cache)."""
+    canon: str
+    tokens: Tuple[str, ...]
+    dm_codes: Tuple[str, ...]
+
+
+_EMPTY_RESULT = CanonResult("", (), ())
+
+# Precompiled patterns (canonicalize runs for every query and synced row)
+_NON_ALNUM_RE = re.compile(r'[^a-z0-9&\s]+')
+
+# Same filter as a full ASCII translate table (each char to one space;
+# runs of spaces are collapsed later by the token split)
+_NON_ALNUM_TABLE = str.maketrans({
+    chr(c): ' ' if _NON_ALNUM_RE.fullmatch(chr(c)) else chr(c)
+    for c in range(128)
+})
+_ABBREV_RE = re.compile(r'\b(' + '|'.join(re.escape(k) for k in ABBREVIATIONS) + r')\b')
+_INITIALS_RE = re.compile(r'^[a-z]\.([a-z]\.)*$')
+_TRAILING_DIGITS_RE = re.compile(r'^[a-z]+\d+$')
+_DIGITS_SUFFIX_RE = re.compile(r'\d+$')
+
+# Tokens dropped from the canonical form
+_STOP_TOKENS = GENERIC_WORDS | CORPORATE_SUFFIXES
+
+# Memoized Double Metaphone (tokens recur heavily across payee names)
+_dm_cache = lru_cache(maxsize=65536)(doublemetaphone)
+
+
 def remove_diacritics(text: str) -> str:
     """Remove diacritics from Unicode string."""
+    # NFKD leaves pure ASCII unchanged, so most payee names skip the work
+    if text.isascii():
+        return text
+    
     nfkd = unicodedata.normalize('NFKD', text)
     return ''.join([c for c in nfkd if not unicodedata.combining(c)])
 
 
-def canonicalize(name_raw: str) -> Dict[str, any]:
+@lru_cache(maxsize=100_000)
+def canonicalize(name_raw: str) -> CanonResult:
     """
     Canonicalize a payee name with deterministic rules.
     
+    Results are memoized, so repeated names skip the whole pipeline.
+    
     Returns:
-        Dict with:
+        CanonResult with:
         - canon: canonicalized string
         - tokens: unique sorted tokens
         - dm_codes: double metaphone codes
     """
     if not name_raw or not name_raw.strip():
-        return {
-            "canon": "",
-            "tokens": [],
-            "dm_codes": []
-        }
+        return _EMPTY_RESULT
     
     # Start with lowercase
     text = name_raw.lower().strip()
@@ -76,72 +112,108 @@ def canonicalize(name_raw: str) -> Dict[str, any]:
     text = remove_diacritics(text)
     
     # Replace non-alphanumeric with space (keep & for companies like AT&T)
-    text = re.sub(r'[^a-z0-9&\s]+', ' ', text)
+    if text.isascii():
+        text = text.translate(_NON_ALNUM_TABLE)
+    else:
+        text = _NON_ALNUM_RE.sub(' ', text)
     
-    # Expand common abbreviations
-    for abbr, full in ABBREVIATIONS.items():
-        text = re.sub(rf'\b{abbr}\b', full, text)
+    # Expand common abbreviations (single pass over all of them)
+    text = _ABBREV_RE.sub(lambda m: ABBREVIATIONS[m.group(1)], text)
     
-    # Tokenize
-    tokens = text.split()
+    # Filter, special-case, dedup and encode tokens
+    canon, tokens, dm_codes = canonicalize_tokens(text)
     
-    # Remove generic words and corporate suffixes
-    tokens = [t for t in tokens 
-              if t not in GENERIC_WORDS and t not in CORPORATE_SUFFIXES]
+    return CanonResult(canon, tuple(tokens), tuple(dm_codes))
+
+
+def canonicalize_batch(names: List[str]) -> List[CanonResult]:
+    """
+    Canonicalize many payee names at once.
     
-    # Handle special cases
-    tokens = handle_special_cases(tokens)
+    Duplicate names are processed once. The string normalization phases
+    run as pandas vector ops over the distinct names; only the token pass
+    runs per distinct normalized text.
     
-    # Remove empty tokens and duplicates, then sort
-    tokens = sorted(set(t for t in tokens if t))
+    Returns:
+        List of CanonResult in input order
+    """
+    if not names:
+        return []
     
-    # Build canonical name
-    canon = ' '.join(tokens)
+    # Supplier dumps repeat names (one row per location), so dedupe first
+    unique_names = list(dict.fromkeys(names))
+    text = pd.Series(unique_names, dtype=object)
     
-    # Generate double metaphone codes for each token
-    dm_codes = []
-    for token in tokens:
-        codes = doublemetaphone(token)
-        dm_codes.extend([c for c in codes if c])
+    # Lowercase, remove diacritics, replace non-alphanumerics, expand abbreviations
+    text = text.str.lower().str.strip()
+    text = text.str.normalize('NFKD').str.replace(_combining_re(), '', regex=True)
+    text = text.str.replace(_NON_ALNUM_RE, ' ', regex=True)
+    text = text.str.replace(_ABBREV_RE, lambda m: ABBREVIATIONS[m.group(1)], regex=True)
+    text = text.fillna('')
     
-    # Remove duplicates from dm_codes
-    dm_codes = list(set(dm_codes))
+    results = {}
+    for t in text.unique():
+        canon, tokens, dm_codes = canonicalize_tokens(t)
+        results[t] = CanonResult(canon, tuple(tokens), tuple(dm_codes))
     
-    return {
-        "canon": canon,
-        "tokens": tokens,
-        "dm_codes": dm_codes
-    }
+    by_name = {name: results[t] for name, t in zip(unique_names, text)}
+    return [by_name[name] for name in names]
+
 
+@lru_cache(maxsize=None)
+def _combining_re() -> re.Pattern:
+    """Pattern matching the combining marks remove_diacritics drops (built on first use)."""
+    marks = ''.join(
+        chr(c) for c in range(sys.maxunicode + 1)
+        if unicodedata.combining(chr(c))
+    )
+    return re.compile('[' + re.escape(marks) + ']+')
 
-def handle_special_cases(tokens: List[str]) -> List[str]:
-    """Handle special cases in tokenization."""
-    result = []
+
+def canonicalize_tokens(text: str) -> Tuple[str, List[str], List[str]]:
+    """
+    Turn normalized text into its canonical tokens.
     
-    for token in tokens:
-        # Handle initials (e.g., "j.p." -> "jp")
-        if re.match(r'^[a-z]\.([a-z]\.)*$', token):
-            token = token.replace('.', '')
-        
-        # Handle hyphenated names
-        if '-' in token and len(token) > 1:
-            # Keep as is for now, but could split
-            pass
-        
-        # Handle numbers at end (e.g., "company2" -> "company")
-        # But keep pure numbers
-        if re.match(r'^[a-z]+\d+$', token):
-            token = re.sub(r'\d+$', '', token)
+    This is the per-token hot loop of canonicalization, done in one pass:
+    stop-token filtering, special cases, dedup/sort and double metaphone.
+    
+    Returns:
+        Tuple of (canon, tokens, dm_codes)
+    """
+    tokens = set()
+    for token in text.split():
+        # Remove generic words and corporate suffixes
+        if token in _STOP_TOKENS:
+            continue
         
-        result.append(token)
+        token = handle_special_case(token)
+        if token:
+            tokens.add(token)
+    
+    tokens = sorted(tokens)
+    
+    # Generate unique double metaphone codes across all tokens
+    dm_codes = list({code for token in tokens for code in _dm_cache(token) if code})
+    
+    return ' '.join(tokens), tokens, dm_codes
+
+
+def handle_special_case(token: str) -> str:
+    """Handle special cases for a single token."""
+    # Handle initials (e.g., "j.p." -> "jp")
+    if '.' in token and _INITIALS_RE.match(token):
+        token = token.replace('.', '')
+    
+    # Handle numbers at end (e.g., "company2" -> "company")
+    # But keep pure numbers
+    if token[-1:].isdigit() and _TRAILING_DIGITS_RE.match(token):
+        token = _DIGITS_SUFFIX_RE.sub('', token)
     
-    return result
+    return token
 
 
-def is_exact_match(name1: str, name2: str) -> bool:
-    """Fast path for exact matches after canonicalization."""
-    canon1 = canonicalize(name1)["canon"]
-    canon2 = canonicalize(name2)["canon"]
+def is_exact_match(canon1: str, canon2: str) -> bool:
+    """Fast path for exact matches on already canonicalized names."""
     return canon1 == canon2
 
 
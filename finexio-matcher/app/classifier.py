@@ -1,21 +1,81 @@
 """Machine learning classifier for match scoring."""
 
 import os
-import json
 import numpy as np
 from typing import List, Dict, Any, Tuple
 import joblib
+import orjson
+from scipy.special import expit
+from sklearn.base import clone
+from sklearn.isotonic import IsotonicRegression
 from sklearn.linear_model import LogisticRegression
-from sklearn.calibration import CalibratedClassifierCV
+from sklearn.model_selection import StratifiedKFold
 import structlog
 
-from app.features import get_feature_names
+from app.features import FEATURE_INDEX, STRING_SCORERS
 
 logger = structlog.get_logger()
 
 MODEL_PATH = "artifacts/model.joblib"
 FEATURE_NAMES_PATH = "artifacts/feature_names.json"
 
+# Folds used to fit the logistic models and their out-of-fold calibration
+CALIBRATION_FOLDS = 3
+
+# Hand-tuned heuristic weights. The special case flags are 0/1 features, so
+# their bonuses are plain weights too.
+HEURISTIC_WEIGHTS = {
+    # Token-based similarities (most reliable)
+    "token_set_ratio": 0.25,
+    "token_sort_ratio": 0.20,
+    # String similarities
+    "jaro_winkler": 0.15,
+    "levenshtein": 0.10,
+    # Candidate scores
+    "trgm_score": 0.10,
+    "vec_score": 0.05,
+    # Phonetic matching
+    "dm_jaccard": 0.05,
+    # Token overlap
+    "token_jaccard": 0.05,
+    # Special cases
+    "initials_match": 0.05,
+    "is_abbreviation": 0.10,
+    "has_common_variation": 0.10
+}
+
+# Weights used to explain a decision (heuristic weights plus exact match)
+EXPLAIN_WEIGHTS = {
+    "token_set_ratio": 0.25,
+    "token_sort_ratio": 0.20,
+    "jaro_winkler": 0.15,
+    "levenshtein": 0.10,
+    "trgm_score": 0.10,
+    "vec_score": 0.05,
+    "dm_jaccard": 0.05,
+    "token_jaccard": 0.05,
+    "exact_match": 1.0,
+    "initials_match": 0.05,
+    "is_abbreviation": 0.10,
+    "has_common_variation": 0.10
+}
+
+# Weight vector aligned with FEATURE_NAMES for a single dot product.
+# Kept in float64 (as are the dot products) so scores don't pick up float32
+# rounding in responses or threshold comparisons.
+_WEIGHTS = np.zeros(len(FEATURE_INDEX), dtype=np.float64)
+for _name, _weight in HEURISTIC_WEIGHTS.items():
+    _WEIGHTS[FEATURE_INDEX[_name]] = _weight
+_EXACT_IDX = FEATURE_INDEX["exact_match"]
+_STRING_IDX = [FEATURE_INDEX[name] for name, _, _, _ in STRING_SCORERS]
+_SCORE_IDX = [FEATURE_INDEX[name] for name in ("trgm_score", "vec_score", "dm_score")]
+_LEN_RATIO_IDX = FEATURE_INDEX["len_ratio"]
+
+# Explanation columns and weights, in EXPLAIN_WEIGHTS order
+_EXPLAIN_NAMES = list(EXPLAIN_WEIGHTS)
+_EXPLAIN_IDX = np.array([FEATURE_INDEX[name] for name in _EXPLAIN_NAMES])
+_EXPLAIN_WEIGHTS = np.array(list(EXPLAIN_WEIGHTS.values()), dtype=np.float64)
+
 
 class PayeeClassifier:
     """Classifier for payee matching."""
@@ -38,8 +98,8 @@ class PayeeClassifier:
         if os.path.exists(MODEL_PATH) and os.path.exists(FEATURE_NAMES_PATH):
             try:
                 self.model = joblib.load(MODEL_PATH)
-                with open(FEATURE_NAMES_PATH, 'r') as f:
-                    self.feature_names = json.load(f)
+                with open(FEATURE_NAMES_PATH, 'rb') as f:
+                    self.feature_names = orjson.loads(f.read())
                 self.is_trained = True
                 logger.info("model_loaded", path=MODEL_PATH)
             except Exception as e:
@@ -51,8 +111,8 @@ class PayeeClassifier:
         if self.model and self.feature_names:
             os.makedirs("artifacts", exist_ok=True)
             joblib.dump(self.model, MODEL_PATH)
-            with open(FEATURE_NAMES_PATH, 'w') as f:
-                json.dump(self.feature_names, f)
+            with open(FEATURE_NAMES_PATH, 'wb') as f:
+                f.write(orjson.dumps(self.feature_names))
             logger.info("model_saved", path=MODEL_PATH)
     
     def train(self, X: np.ndarray, y: np.ndarray, feature_names: List[str]):
@@ -66,6 +126,10 @@ class PayeeClassifier:
         """
         logger.info("training_classifier", samples=len(X))
         
+        # Match the float32 feature vectors seen at inference
+        X = np.asarray(X, dtype=np.float32)
+        y = np.asarray(y)
+        
         # Train logistic regression
         base_model = LogisticRegression(
             class_weight='balanced',
@@ -73,14 +137,30 @@ class PayeeClassifier:
             random_state=42
         )
         
-        # Wrap with calibration
-        self.model = CalibratedClassifierCV(
-            base_model,
-            method='isotonic',
-            cv=3
-        )
+        # Fit one model per fold and score its held-out fold, so the
+        # calibration sees out-of-fold scores (as CalibratedClassifierCV does)
+        folds = StratifiedKFold(n_splits=CALIBRATION_FOLDS)
+        raw_scores = np.empty(len(X))
+        coefs = []
+        intercepts = []
+        
+        for train_idx, test_idx in folds.split(X, y):
+            fold_model = clone(base_model).fit(X[train_idx], y[train_idx])
+            raw_scores[test_idx] = fold_model.decision_function(X[test_idx])
+            coefs.append(fold_model.coef_[0])
+            intercepts.append(fold_model.intercept_[0])
+        
+        # Collapse the fold models into one linear model
+        calibrator = IsotonicRegression(out_of_bounds="clip")
+        calibrator.fit(expit(raw_scores), y)
+        
+        self.model = {
+            "coef": np.mean(coefs, axis=0).astype(np.float64),
+            "intercept": float(np.mean(intercepts)),
+            "x_thresholds": calibrator.X_thresholds_,
+            "y_thresholds": calibrator.y_thresholds_
+        }
         
-        self.model.fit(X, y)
         self.feature_names = feature_names
         self.is_trained = True
         
@@ -99,21 +179,42 @@ class PayeeClassifier:
         Returns:
             Probability of match (0-1)
         """
+        # Ensure 2D array
+        if features.ndim == 1:
+            features = features.reshape(1, -1)
+        
+        return float(self.predict_proba_batch(features[:1])[0])
+    
+    def predict_proba_batch(self, X: np.ndarray) -> np.ndarray:
+        """
+        Predict match probabilities for all candidates at once.
+        
+        Args:
+            X: Feature matrix, one row per candidate
+            
+        Returns:
+            Array of probabilities (0-1)
+        """
         if self.is_trained and self.model:
             # Use trained model
             try:
-                # Ensure 2D array
-                if features.ndim == 1:
-                    features = features.reshape(1, -1)
+                if isinstance(self.model, dict):
+                    return self.calibrated_scores(X)
                 
-                proba = self.model.predict_proba(features)[0, 1]
-                return float(proba)
+                # Older artifacts hold a full sklearn estimator
+                return self.model.predict_proba(X)[:, 1]
             except Exception as e:
                 logger.error("prediction_failed", error=str(e))
-                return self.heuristic_score(features)
+                return self.heuristic_scores(X)
         else:
             # Use heuristic
-            return self.heuristic_score(features)
+            return self.heuristic_scores(X)
+    
+    def calibrated_scores(self, X: np.ndarray) -> np.ndarray:
+        """Trained model scores: logistic output mapped through the calibration."""
+        X = np.asarray(X, dtype=np.float64)
+        raw = expit(X @ self.model["coef"] + self.model["intercept"])
+        return np.interp(raw, self.model["x_thresholds"], self.model["y_thresholds"])
     
     def heuristic_score(self, features: np.ndarray) -> float:
         """
@@ -121,55 +222,50 @@ class PayeeClassifier:
         
         This provides a reasonable baseline using hand-tuned weights.
         """
-        # Get feature dict for easier access
-        feature_names = get_feature_names()
         if features.ndim == 1:
-            feature_dict = dict(zip(feature_names, features))
-        else:
-            feature_dict = dict(zip(feature_names, features[0]))
-        
-        # Exact match - highest confidence
-        if feature_dict.get("exact_match", 0) == 1.0:
-            return 0.99
-        
-        # Strong indicators
-        score = 0.0
+            features = features.reshape(1, -1)
         
-        # Token-based similarities (most reliable)
-        score += feature_dict.get("token_set_ratio", 0) * 0.25
-        score += feature_dict.get("token_sort_ratio", 0) * 0.20
-        
-        # String similarities
-        score += feature_dict.get("jaro_winkler", 0) * 0.15
-        score += feature_dict.get("levenshtein", 0) * 0.10
-        
-        # Candidate scores
-        score += feature_dict.get("trgm_score", 0) * 0.10
-        score += feature_dict.get("vec_score", 0) * 0.05
-        
-        # Phonetic matching
-        score += feature_dict.get("dm_jaccard", 0) * 0.05
+        return float(self.heuristic_scores(features[:1])[0])
+    
+    def heuristic_scores(self, X: np.ndarray) -> np.ndarray:
+        """Heuristic scores for a feature matrix (see heuristic_score)."""
+        X = np.asarray(X, dtype=np.float64)
+        scores = X @ _WEIGHTS
         
-        # Token overlap
-        score += feature_dict.get("token_jaccard", 0) * 0.05
+        # Penalize large length differences
+        scores = np.where(X[:, _LEN_RATIO_IDX] < 0.5, scores * 0.8, scores)
         
-        # Special cases
-        if feature_dict.get("initials_match", 0) == 1.0:
-            score += 0.05
+        # Ensure score is in [0, 1]
+        scores = np.clip(scores, 0.0, 1.0)
         
-        if feature_dict.get("is_abbreviation", 0) == 1.0:
-            score += 0.10
+        # Exact match - highest confidence
+        return np.where(X[:, _EXACT_IDX] == 1.0, 0.99, scores)
+    
+    def heuristic_upper_bounds(
+        self,
+        string_sims: np.ndarray,
+        candidates: List[Dict[str, Any]]
+    ) -> np.ndarray:
+        """
+        Highest heuristic score each candidate could still reach.
         
-        if feature_dict.get("has_common_variation", 0) == 1.0:
-            score += 0.10
+        Only the string similarities and candidate generation scores are
+        known; every other weighted feature is taken at its maximum of 1.
+        The length penalty and clipping only lower a score, and an exact
+        match has all string similarities at 1, so it is never bounded out.
         
-        # Penalize large length differences
-        len_ratio = feature_dict.get("len_ratio", 1.0)
-        if len_ratio < 0.5:
-            score *= 0.8
+        Args:
+            string_sims: Output of compute_string_similarities
+            candidates: Candidates from get_candidates, one per row
+            
+        Returns:
+            Array of upper bounds (0-1)
+        """
+        X = np.ones((len(candidates), len(FEATURE_INDEX)), dtype=np.float64)
+        X[:, _STRING_IDX] = string_sims
+        X[:, _SCORE_IDX] = [c["scores"] for c in candidates]
         
-        # Ensure score is in [0, 1]
-        return min(max(score, 0.0), 1.0)
+        return np.clip(X @ _WEIGHTS, 0.0, 1.0)
     
     def explain(self, features: np.ndarray, top_n: int = 5) -> List[Tuple[str, float]]:
         """
@@ -182,42 +278,35 @@ class PayeeClassifier:
         Returns:
             List of (feature_name, contribution) tuples
         """
-        feature_names = get_feature_names()
-        
         if features.ndim == 1:
-            feature_dict = dict(zip(feature_names, features))
-        else:
-            feature_dict = dict(zip(feature_names, features[0]))
+            features = features.reshape(1, -1)
+        
+        return self.explain_batch(features[:1], top_n)[0]
+    
+    def explain_batch(self, X: np.ndarray, top_n: int = 5) -> List[List[Tuple[str, float]]]:
+        """
+        Explain decisions for all candidates at once.
         
+        Args:
+            X: Feature matrix, one row per candidate
+            top_n: Number of top features to return per candidate
+            
+        Returns:
+            List of (feature_name, contribution) lists, one per row
+        """
         # For heuristic, return weighted features
-        weighted = []
-        
-        # These are the weights from heuristic_score
-        weights = {
-            "token_set_ratio": 0.25,
-            "token_sort_ratio": 0.20,
-            "jaro_winkler": 0.15,
-            "levenshtein": 0.10,
-            "trgm_score": 0.10,
-            "vec_score": 0.05,
-            "dm_jaccard": 0.05,
-            "token_jaccard": 0.05,
-            "exact_match": 1.0,
-            "initials_match": 0.05,
-            "is_abbreviation": 0.10,
-            "has_common_variation": 0.10
-        }
+        contributions = np.asarray(X[:, _EXPLAIN_IDX], dtype=np.float64) * _EXPLAIN_WEIGHTS
         
-        for name, weight in weights.items():
-            value = feature_dict.get(name, 0)
-            contribution = value * weight
-            if contribution > 0:
-                weighted.append((name, contribution))
+        # Sort by contribution (stable, so ties keep EXPLAIN_WEIGHTS order)
+        order = np.argsort(-contributions, axis=1, kind="stable")[:, :top_n]
         
-        # Sort by contribution
-        weighted.sort(key=lambda x: x[1], reverse=True)
+        explanations = []
+        for row, top in zip(contributions.tolist(), order.tolist()):
+            explanations.append([
+                (_EXPLAIN_NAMES[i], row[i]) for i in top if row[i] > 0
+            ])
         
-        return weighted[:top_n]
+        return explanations
 
 
 # Global classifier instance
@@ -24,6 +24,9 @@ class Settings(BaseSettings):
     embeddings_provider: str = Field("openai", description="Embeddings provider: openai or local")
     embedding_model: str = Field("text-embedding-3-large", description="OpenAI embedding model")
     embedding_dim: int = Field(1024, description="Embedding dimension")
+    embedding_disk_cache_path: Optional[str] = Field(
+        None, description="LMDB directory for an on-disk embedding cache (needs lmdb)"
+    )
     
     # Reranking Configuration
     rerank_provider: str = Field("none", description="Rerank provider: openai or none")
@@ -31,6 +34,7 @@ class Settings(BaseSettings):
     # Matching Configuration
     topk_trigram: int = Field(50, description="Top K for trigram similarity")
     topk_vector: int = Field(50, description="Top K for vector similarity")
+    hnsw_ef_search: int = Field(64, description="HNSW search list size (keep >= topk_vector)")
     topk_phonetic: int = Field(50, description="Top K for phonetic similarity")
     k_union: int = Field(120, description="Top K after union/dedupe")
     t_high: float = Field(0.97, description="Auto-match threshold")
@@ -39,6 +43,7 @@ class Settings(BaseSettings):
     # Performance Configuration
     batch_workers: int = Field(8, description="Number of batch workers")
     batch_chunk_size: int = Field(1000, description="Batch chunk size")
+    batch_use_processes: bool = Field(False, description="Run batch workers in a process pool started at startup")
     
     # Application Configuration
     log_level: str = Field("INFO", description="Logging level")
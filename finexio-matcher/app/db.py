@@ -2,10 +2,12 @@
 
 import os
 from contextlib import contextmanager
-from sqlalchemy import create_engine, text
+from sqlalchemy import create_engine, event, text
 from sqlalchemy.orm import sessionmaker, Session
 from sqlalchemy.ext.declarative import declarative_base
+import orjson
 import structlog
+from pgvector.psycopg2 import register_vector
 
 from app.config import settings
 
@@ -17,15 +19,70 @@ engine = create_engine(
     pool_size=20,
     max_overflow=40,
     pool_pre_ping=True,
-    echo=False
+    echo=False,
+    # JSON/JSONB parameters (e.g. review queue candidates) and results
+    json_serializer=lambda obj: orjson.dumps(obj).decode(),
+    json_deserializer=orjson.loads
 )
 
+
+@event.listens_for(engine, "connect")
+def register_vector_type(dbapi_connection, connection_record):
+    """Register pgvector types so vectors bind and load as numpy arrays."""
+    try:
+        register_vector(dbapi_connection)
+    except Exception as e:
+        # Extension not created yet; init_database() resets the pool after
+        logger.warning("pgvector_register_skipped", error=str(e))
+    finally:
+        # End the implicit transaction opened by the type lookup
+        dbapi_connection.rollback()
+
+
+@event.listens_for(engine, "connect")
+def set_hnsw_ef_search(dbapi_connection, connection_record):
+    """Size the HNSW search list so vector lookups can return topk_vector rows."""
+    with dbapi_connection.cursor() as cur:
+        cur.execute("SET hnsw.ef_search = %s", (settings.hnsw_ef_search,))
+    
+    # Commit so the session setting survives later rollbacks
+    dbapi_connection.commit()
+
+
 # Session factory
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 # Base class for models
 Base = declarative_base()
 
+# Older schemas allowed several payees per bq_supplier_id. Before the unique
+# index is built, duplicates collapse onto the most recently updated row,
+# with labels repointed first so ON DELETE CASCADE doesn't drop them.
+PAYEE_DUPLICATES_SQL = """
+    SELECT payee_id,
+           FIRST_VALUE(payee_id) OVER (
+               PARTITION BY bq_supplier_id
+               ORDER BY updated_at DESC, payee_id DESC
+           ) AS keep_id
+    FROM payees
+    WHERE bq_supplier_id IS NOT NULL
+"""
+
+REPOINT_DUPLICATE_LABELS_SQL = text(f"""
+    UPDATE labels l
+    SET c_payee_id = d.keep_id
+    FROM ({PAYEE_DUPLICATES_SQL}) d
+    WHERE l.c_payee_id = d.payee_id AND d.payee_id <> d.keep_id
+""")
+
+DELETE_DUPLICATE_PAYEES_SQL = text(f"""
+    DELETE FROM payees p
+    USING ({PAYEE_DUPLICATES_SQL}) d
+    WHERE p.payee_id = d.payee_id AND d.payee_id <> d.keep_id
+""")
+
+NAME_VEC_TYPE = "halfvec(1024)"
+
 
 def init_database():
     """Initialize database with schema."""
@@ -38,17 +95,54 @@ def init_database():
         # Execute schema SQL in a transaction
         trans = conn.begin()
         try:
+            migrate_payees(conn)
+            
             for statement in schema_sql.split(";"):
                 if statement.strip():
                     conn.execute(text(statement))
             trans.commit()
             logger.info("database_initialized", status="success")
+            
+            # Reconnect so new connections see the vector type
+            engine.dispose()
         except Exception as e:
             trans.rollback()
             logger.error("database_init_failed", error=str(e))
             raise
 
 
+def migrate_payees(conn):
+    """
+    Bring a payees table created by an older schema up to date.
+    
+    Runs before schema.sql so its unique bq_supplier_id index and halfvec
+    HNSW index can be built; each step only runs while still needed.
+    
+    Args:
+        conn: Connection inside the init_database transaction
+    """
+    if conn.execute(text("SELECT to_regclass('payees')")).scalar() is None:
+        return
+    
+    if conn.execute(text("SELECT to_regclass('payees_bq_supplier_uidx')")).scalar() is None:
+        conn.execute(REPOINT_DUPLICATE_LABELS_SQL)
+        removed = conn.execute(DELETE_DUPLICATE_PAYEES_SQL).rowcount
+        logger.info("payee_duplicates_removed", count=removed)
+    
+    vec_type = conn.execute(text("""
+        SELECT format_type(atttypid, atttypmod)
+        FROM pg_attribute
+        WHERE attrelid = 'payees'::regclass AND attname = 'name_vec'
+    """)).scalar()
+    if vec_type and vec_type != NAME_VEC_TYPE:
+        # The old index uses vector opclasses; schema.sql rebuilds it
+        conn.execute(text("DROP INDEX IF EXISTS payees_name_vec_hnsw"))
+        conn.execute(text(
+            f"ALTER TABLE payees ALTER COLUMN name_vec TYPE {NAME_VEC_TYPE}"
+        ))
+        logger.info("payee_name_vec_migrated", from_type=vec_type, to_type=NAME_VEC_TYPE)
+
+
 @contextmanager
 def get_db() -> Session:
     """Get database session."""
@@ -59,6 +153,25 @@ def get_db() -> Session:
         db.close()
 
 
+def ensure_prepared(db: Session, name: str, prepare_sql: str):
+    """
+    PREPARE a named statement once per pooled connection.
+    
+    Prepared statements live as long as the DBAPI connection, as does the
+    pool's per-connection info dict, so that is where they are tracked.
+    
+    Args:
+        db: Session whose connection will EXECUTE the statement
+        name: Statement name used in PREPARE/EXECUTE
+        prepare_sql: Full PREPARE statement
+    """
+    conn = db.connection()
+    prepared = conn.info.setdefault("prepared_statements", set())
+    if name not in prepared:
+        conn.execute(text(prepare_sql))
+        prepared.add(name)
+
+
 def check_extensions():
     """Check if required PostgreSQL extensions are installed."""
     with engine.connect() as conn:
@@ -1,19 +1,86 @@
 """Feature engineering for candidate pairs."""
 
 import json
+from functools import lru_cache
+from operator import itemgetter
 from typing import Dict, List, Tuple, Any
 import numpy as np
-from rapidfuzz import fuzz, distance
+from rapidfuzz import fuzz, distance, process
 import structlog
 
-from app.canonicalize import canonicalize, extract_initials
-from app.utils import cosine_similarity
+from app.canonicalize import canonicalize, extract_initials, CanonResult
 
 logger = structlog.get_logger()
 
 # Global IDF cache (populated at startup)
 IDF_CACHE = {}
 
+# Global payee record cache keyed by payee_id (populated at startup,
+# filled on misses by matching.fetch_payee_records)
+PAYEE_CACHE: Dict[int, Dict[str, Any]] = {}
+
+PAYEE_RECORD_SQL = """
+    SELECT payee_id, name_raw, name_canon, name_tokens,
+           dm_codes, bq_supplier_id, address, city, state
+    FROM payees
+"""
+
+# Rows streamed per fetch when loading the payee cache
+PAYEE_CACHE_FETCH_SIZE = 10000
+
+# Invalidation counter shared with batch worker processes, which hold their
+# own PAYEE_CACHE copies (see app.matching.start_match_pool)
+_cache_generation = None
+_seen_generation = 0
+
+# Feature vector order (sorted names), fixed once at import
+FEATURE_NAMES: Tuple[str, ...] = tuple(sorted([
+    "token_set_ratio", "token_sort_ratio", "partial_ratio",
+    "ratio", "partial_token_ratio",
+    "levenshtein", "jaro_winkler", "hamming",
+    "trgm_score", "vec_score", "dm_score", "num_sources",
+    "dm_jaccard", "dm_overlap_count", "dm_overlap_ratio",
+    "token_jaccard", "token_overlap_count", "token_overlap_ratio",
+    "len_diff_abs", "len_ratio", "token_count_diff", "token_count_ratio",
+    "idf_overlap",
+    "initials_match", "is_abbreviation", "has_common_variation",
+    "exact_match", "exact_match_raw"
+]))
+FEATURE_INDEX = {name: i for i, name in enumerate(FEATURE_NAMES)}
+_feature_values = itemgetter(*FEATURE_NAMES)
+
+# RapidFuzz string similarity features as (name, scorer, scale, is_distance)
+STRING_SCORERS = (
+    # Token-based similarities
+    ("token_set_ratio", fuzz.token_set_ratio, 100.0, False),
+    ("token_sort_ratio", fuzz.token_sort_ratio, 100.0, False),
+    ("partial_ratio", fuzz.partial_ratio, 100.0, False),
+    # Character-based similarities
+    ("ratio", fuzz.ratio, 100.0, False),
+    ("partial_token_ratio", fuzz.partial_token_ratio, 100.0, False),
+    # Distance metrics
+    ("levenshtein", distance.Levenshtein.normalized_distance, 1.0, True),
+    ("jaro_winkler", distance.JaroWinkler.similarity, 1.0, False),
+    ("hamming", distance.Hamming.normalized_distance, 1.0, True),
+)
+
+# Common business name variations as (long form, short form) tokens
+COMMON_VARIATIONS = tuple(
+    (f" {long_form} ", f" {short_form} ")
+    for long_form, short_form in [
+        ("and", "&"),
+        ("corporation", "corp"),
+        ("incorporated", "inc"),
+        ("limited", "ltd"),
+        ("company", "co"),
+        ("international", "intl"),
+        ("national", "natl"),
+        ("associates", "assoc"),
+        ("management", "mgmt"),
+        ("services", "svcs"),
+    ]
+)
+
 
 def load_idf_cache(db):
     """Load IDF scores from database at startup."""
@@ -42,16 +109,144 @@ def load_idf_cache(db):
         for token, df in token_df.items():
             IDF_CACHE[token] = math.log(total_docs / df) if df > 0 else 0
         
+        get_query_idf.cache_clear()
+        
         logger.info("idf_cache_loaded", tokens=len(IDF_CACHE), docs=total_docs)
         
     except Exception as e:
         logger.error("idf_cache_failed", error=str(e))
 
 
+def payee_record(row) -> Dict[str, Any]:
+    """Build a cached payee record from a PAYEE_RECORD_SQL row."""
+    return {
+        "payee_id": row[0],
+        "name_raw": row[1],
+        "name_canon": row[2],
+        "name_tokens": frozenset(row[3] or ()),
+        "dm_codes": frozenset(row[4] or ()),
+        "bq_supplier_id": row[5],
+        "address": row[6],
+        "city": row[7],
+        "state": row[8]
+    }
+
+
+def load_payee_cache(db):
+    """Load all payee records into PAYEE_CACHE at startup."""
+    try:
+        from sqlalchemy import text
+        
+        result = db.execute(
+            text(PAYEE_RECORD_SQL),
+            execution_options={"yield_per": PAYEE_CACHE_FETCH_SIZE}
+        )
+        
+        records = {}
+        for row in result:
+            records[row[0]] = payee_record(row)
+        
+        PAYEE_CACHE.clear()
+        PAYEE_CACHE.update(records)
+        
+        logger.info("payee_cache_loaded", payees=len(PAYEE_CACHE))
+        
+    except Exception as e:
+        logger.error("payee_cache_failed", error=str(e))
+
+
+def invalidate_payee_cache(payee_ids: List[int] = None):
+    """
+    Drop stale payee records after a write.
+    
+    Args:
+        payee_ids: Payees to drop, or None to clear the whole cache
+    """
+    global _seen_generation
+    
+    if payee_ids is None:
+        PAYEE_CACHE.clear()
+    else:
+        for payee_id in payee_ids:
+            PAYEE_CACHE.pop(payee_id, None)
+    
+    # Tell processes sharing the counter that their copies are stale
+    if _cache_generation is not None:
+        with _cache_generation.get_lock():
+            _cache_generation.value += 1
+            _seen_generation = _cache_generation.value
+
+
+def share_payee_cache_generation(generation):
+    """
+    Track PAYEE_CACHE invalidations through a counter shared across processes.
+    
+    Args:
+        generation: multiprocessing.Value bumped by invalidate_payee_cache
+    """
+    global _cache_generation, _seen_generation
+    
+    _cache_generation = generation
+    _seen_generation = generation.value
+
+
+def refresh_stale_payee_cache():
+    """
+    Clear PAYEE_CACHE if another process invalidated it since the last check.
+    
+    The changed payee ids aren't shared, so the whole cache is dropped;
+    records are refetched on demand by matching.fetch_payee_records.
+    """
+    global _seen_generation
+    
+    if _cache_generation is None:
+        return
+    
+    generation = _cache_generation.value
+    if generation != _seen_generation:
+        PAYEE_CACHE.clear()
+        _seen_generation = generation
+
+
+@lru_cache(maxsize=10000)
+def get_query_idf(q_tokens: Tuple[str, ...]) -> Tuple[Dict[str, float], float]:
+    """
+    Get IDF weights for a query's tokens, looked up once per query.
+    
+    Returns:
+        Tuple of (token -> idf, sum of idf over all query tokens)
+    """
+    idf = {token: IDF_CACHE.get(token, 0) for token in q_tokens}
+    return idf, sum(idf[token] for token in set(q_tokens))
+
+
+def compute_string_similarities(query_canon: str, candidate_canons: List[str]) -> np.ndarray:
+    """
+    Compute the RapidFuzz similarity features for many candidates at once.
+    
+    Each scorer runs as one batched cdist call over all candidates instead
+    of one Python-level call per candidate.
+    
+    Returns:
+        Array of shape (len(candidate_canons), len(STRING_SCORERS))
+    """
+    sims = np.empty((len(candidate_canons), len(STRING_SCORERS)))
+    if not candidate_canons:
+        return sims
+    
+    for j, (_, scorer, scale, is_distance) in enumerate(STRING_SCORERS):
+        scores = process.cdist([query_canon], candidate_canons, scorer=scorer, dtype=np.float64)[0]
+        sims[:, j] = 1.0 - scores if is_distance else scores / scale
+    
+    return sims
+
+
 def compute_features(
     query_name: str,
     candidate_record: Dict[str, Any],
-    candidate_scores: Dict[str, float] = None
+    candidate: Dict[str, Any] = None,
+    precomputed_sims: np.ndarray = None,
+    q_data: CanonResult = None
 ) -> Tuple[np.ndarray, Dict[str, float]]:
     """
     Compute features for a (query, candidate) pair.
@@ -59,7 +254,9 @@ def compute_features(
     Args:
         query_name: Raw query name
         candidate_record: Candidate payee record from DB
-        candidate_scores: Scores from candidate generation
+        candidate: Candidate from get_candidates (per-method scores and source count)
+        precomputed_sims: This candidate's row from compute_string_similarities
+        q_data: Canonicalized query, if the caller already has it
         
     Returns:
         Tuple of (feature_vector, feature_dict)
@@ -67,39 +264,37 @@ def compute_features(
     features = {}
     
     # Canonicalize query
-    q_data = canonicalize(query_name)
-    q_canon = q_data["canon"]
-    q_tokens = set(q_data["tokens"])
-    q_dm = set(q_data["dm_codes"])
+    if q_data is None:
+        q_data = canonicalize(query_name)
+    q_canon = q_data.canon
+    q_tokens = set(q_data.tokens)
+    q_dm = set(q_data.dm_codes)
     
     # Get candidate data
     c_canon = candidate_record.get("name_canon", "")
-    c_tokens = set(candidate_record.get("name_tokens", []))
-    c_dm = set(candidate_record.get("dm_codes", []))
+    c_tokens = frozenset(candidate_record.get("name_tokens", []))
+    c_dm = frozenset(candidate_record.get("dm_codes", []))
     c_raw = candidate_record.get("name_raw", "")
     
     # === RapidFuzz String Similarity Features ===
     
-    # Token-based similarities
-    features["token_set_ratio"] = fuzz.token_set_ratio(q_canon, c_canon) / 100.0
-    features["token_sort_ratio"] = fuzz.token_sort_ratio(q_canon, c_canon) / 100.0
-    features["partial_ratio"] = fuzz.partial_ratio(q_canon, c_canon) / 100.0
-    
-    # Character-based similarities
-    features["ratio"] = fuzz.ratio(q_canon, c_canon) / 100.0
-    features["partial_token_ratio"] = fuzz.partial_token_ratio(q_canon, c_canon) / 100.0
+    if precomputed_sims is None:
+        precomputed_sims = compute_string_similarities(q_canon, [c_canon])[0]
     
-    # Distance metrics
-    features["levenshtein"] = 1.0 - (distance.Levenshtein.normalized_distance(q_canon, c_canon))
-    features["jaro_winkler"] = distance.JaroWinkler.similarity(q_canon, c_canon)
-    features["hamming"] = 1.0 - (distance.Hamming.normalized_distance(q_canon, c_canon))
+    for (name, _, _, _), value in zip(STRING_SCORERS, precomputed_sims.tolist()):
+        features[name] = value
     
     # === Candidate Generation Scores ===
-    if candidate_scores:
-        features["trgm_score"] = candidate_scores.get("trgm", 0.0)
-        features["vec_score"] = candidate_scores.get("vec", 0.0)
-        features["dm_score"] = candidate_scores.get("dm", 0.0)
-        features["num_sources"] = len([v for v in candidate_scores.values() if v > 0])
+    if candidate:
+        (
+            features["trgm_score"],
+            features["vec_score"],
+            features["dm_score"]
+        ) = candidate["scores"]
+        # Methods that scored the candidate; vector scores can be <= 0 or NaN
+        features["num_sources"] = sum(
+            1 for score in candidate["scores"] if score > 0
+        )
     else:
         features["trgm_score"] = 0.0
         features["vec_score"] = 0.0
@@ -123,8 +318,9 @@ def compute_features(
     # === Token-based Features ===
     
     # Token overlap
+    overlapping = q_tokens & c_tokens
     if q_tokens and c_tokens:
-        token_intersection = len(q_tokens & c_tokens)
+        token_intersection = len(overlapping)
         token_union = len(q_tokens | c_tokens)
         features["token_jaccard"] = token_intersection / token_union if token_union > 0 else 0
         features["token_overlap_count"] = token_intersection
@@ -145,9 +341,8 @@ def compute_features(
     
     # IDF-weighted token overlap
     if IDF_CACHE and q_tokens and c_tokens:
-        overlapping = q_tokens & c_tokens
-        idf_sum = sum(IDF_CACHE.get(token, 0) for token in overlapping)
-        max_idf_sum = sum(IDF_CACHE.get(token, 0) for token in q_tokens)
+        q_idf, max_idf_sum = get_query_idf(q_data.tokens)
+        idf_sum = sum(q_idf[token] for token in overlapping)
         features["idf_overlap"] = idf_sum / max_idf_sum if max_idf_sum > 0 else 0
     else:
         features["idf_overlap"] = 0.0
@@ -170,9 +365,8 @@ def compute_features(
     features["exact_match"] = 1.0 if q_canon == c_canon else 0.0
     features["exact_match_raw"] = 1.0 if query_name.lower().strip() == c_raw.lower().strip() else 0.0
     
-    # Convert to numpy array (ensure consistent ordering)
-    feature_names = sorted(features.keys())
-    feature_vector = np.array([features[name] for name in feature_names])
+    # Convert to numpy array in FEATURE_NAMES order
+    feature_vector = np.array(_feature_values(features), dtype=np.float32)
     
     return feature_vector, features
 
@@ -193,46 +387,36 @@ def check_abbreviation(text1: str, text2: str) -> float:
         return 0.0
     
     # Check if all chars of shorter appear in order in longer
+    # (str.find does the forward scan in C)
     j = 0
     for char in shorter:
         if char == ' ':
             continue
-        found = False
-        while j < len(longer):
-            if longer[j] == char:
-                found = True
-                j += 1
-                break
-            j += 1
-        if not found:
+        j = longer.find(char, j)
+        if j < 0:
             return 0.0
+        j += 1
     
     return 1.0
 
 
 def check_common_variations(text1: str, text2: str) -> float:
     """Check for common business name variations."""
-    variations = [
-        ("and", "&"),
-        ("corporation", "corp"),
-        ("incorporated", "inc"),
-        ("limited", "ltd"),
-        ("company", "co"),
-        ("international", "intl"),
-        ("national", "natl"),
-        ("associates", "assoc"),
-        ("management", "mgmt"),
-        ("services", "svcs"),
-    ]
-    
     # Normalize both texts
     t1 = " " + text1.lower() + " "
     t2 = " " + text2.lower() + " "
     
-    for long_form, short_form in variations:
+    if t1.strip() == t2.strip():
+        return 1.0
+    
+    for long_form, short_form in COMMON_VARIATIONS:
+        # A variation can only make them equal if one contains the long form
+        if long_form not in t1 and long_form not in t2:
+            continue
+        
         # Check both directions
-        t1_normalized = t1.replace(f" {long_form} ", f" {short_form} ")
-        t2_normalized = t2.replace(f" {long_form} ", f" {short_form} ")
+        t1_normalized = t1.replace(long_form, short_form)
+        t2_normalized = t2.replace(long_form, short_form)
         
         if t1_normalized.strip() == t2_normalized.strip():
             return 1.0
@@ -240,18 +424,6 @@ def check_common_variations(text1: str, text2: str) -> float:
     return 0.0
 
 
-def get_feature_names() -> List[str]:
-    """Get ordered list of feature names."""
-    # This should match the order in compute_features
-    return sorted([
-        "token_set_ratio", "token_sort_ratio", "partial_ratio",
-        "ratio", "partial_token_ratio",
-        "levenshtein", "jaro_winkler", "hamming",
-        "trgm_score", "vec_score", "dm_score", "num_sources",
-        "dm_jaccard", "dm_overlap_count", "dm_overlap_ratio",
-        "token_jaccard", "token_overlap_count", "token_overlap_ratio",
-        "len_diff_abs", "len_ratio", "token_count_diff", "token_count_ratio",
-        "idf_overlap",
-        "initials_match", "is_abbreviation", "has_common_variation",
-        "exact_match", "exact_match_raw"
-    ])
\ No newline at end of file
+def get_feature_names() -> Tuple[str, ...]:
+    """Get ordered feature names."""
+    return FEATURE_NAMES
@@ -1,21 +1,51 @@
 """Main matching pipeline combining all components."""
 
-from typing import Dict, List, Any, Optional
-import json
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Any, Optional, Tuple
+import math
+import multiprocessing
+import numpy as np
+import orjson
 import structlog
 from sqlalchemy.orm import Session
-from sqlalchemy import text
+from sqlalchemy import bindparam, text
+from sqlalchemy.dialects.postgresql import JSONB
 
 from app.config import settings
-from app.db import get_db
+from app.db import ensure_prepared, get_db
 from app.canonicalize import canonicalize
 from app.candidates import get_candidates
-from app.features import compute_features
+from app.features import (
+    PAYEE_CACHE,
+    PAYEE_RECORD_SQL,
+    compute_features,
+    compute_string_similarities,
+    load_idf_cache,
+    load_payee_cache,
+    payee_record,
+    refresh_stale_payee_cache,
+    share_payee_cache_generation
+)
 from app.classifier import classifier
-from app.utils import batch_process
+from app.utils import batch_process, get_embeddings
 
 logger = structlog.get_logger()
 
+# Top candidates returned in a match response / stored for review
+RESPONSE_CANDIDATES = 5
+REVIEW_CANDIDATES = 10
+
+# Cache-miss lookup, prepared once per connection
+PAYEE_RECORD_STATEMENT = "payee_records"
+PAYEE_RECORD_PREPARE = (
+    f"PREPARE {PAYEE_RECORD_STATEMENT} (bigint[]) AS "
+    f"{PAYEE_RECORD_SQL} WHERE payee_id = ANY($1)"
+)
+
+# Worker processes for batch matching (settings.batch_use_processes),
+# started once by the application lifespan
+_match_pool: Optional[ProcessPoolExecutor] = None
+
 
 def match_one(
     name_raw: str,
@@ -44,7 +74,7 @@ def _match_one_internal(name_raw: str, db: Session) -> Dict[str, Any]:
     
     # Canonicalize
     canon_data = canonicalize(name_raw)
-    canon = canon_data["canon"]
+    canon = canon_data.canon
     
     if not canon:
         return {
@@ -56,7 +86,7 @@ def _match_one_internal(name_raw: str, db: Session) -> Dict[str, Any]:
         }
     
     # Get candidates
-    candidates = get_candidates(db, name_raw)
+    candidates = get_candidates(db, name_raw, canon_data)
     
     if not candidates:
         return {
@@ -67,62 +97,84 @@ def _match_one_internal(name_raw: str, db: Session) -> Dict[str, Any]:
             "reason": "No candidates found"
         }
     
-    # Score each candidate
-    scored_candidates = []
+    # Fetch all candidate records in one query
+    payee_records = fetch_payee_records(
+        db,
+        [candidate["payee_id"] for candidate in candidates]
+    )
     
-    for candidate in candidates:
-        # Get full candidate record
-        payee_record = db.execute(
-            text("""
-                SELECT payee_id, name_raw, name_canon, name_tokens, 
-                       dm_codes, bq_supplier_id, address, city, state
-                FROM payees
-                WHERE payee_id = :id
-            """),
-            {"id": candidate["payee_id"]}
-        ).first()
-        
-        if not payee_record:
-            continue
-        
-        # Convert to dict
-        payee_dict = {
-            "payee_id": payee_record[0],
-            "name_raw": payee_record[1],
-            "name_canon": payee_record[2],
-            "name_tokens": payee_record[3],
-            "dm_codes": payee_record[4],
-            "bq_supplier_id": payee_record[5],
-            "address": payee_record[6],
-            "city": payee_record[7],
-            "state": payee_record[8]
-        }
-        
-        # Compute features
+    candidates = [c for c in candidates if c["payee_id"] in payee_records]
+    
+    # String similarities for all candidates in one batched pass
+    string_sims = compute_string_similarities(
+        canon,
+        [payee_records[c["payee_id"]]["name_canon"] for c in candidates]
+    )
+    
+    # The heuristic can't score a candidate above its upper bound, so skip
+    # feature computation for candidates that could never reach review;
+    # they stay in the ranking with probability 0
+    reachable = np.ones(len(candidates), dtype=bool)
+    if not classifier.is_trained and candidates:
+        reachable = classifier.heuristic_upper_bounds(
+            string_sims,
+            candidates
+        ) >= settings.t_low
+    scored_rows = np.flatnonzero(reachable).tolist()
+    
+    # Compute features for each reachable candidate
+    feature_vectors = []
+    feature_dicts = []
+    
+    for i in scored_rows:
         features, feature_dict = compute_features(
             name_raw,
-            payee_dict,
-            candidate.get("scores", {})
+            payee_records[candidates[i]["payee_id"]],
+            candidates[i],
+            precomputed_sims=string_sims[i],
+            q_data=canon_data
         )
+        feature_vectors.append(features)
+        feature_dicts.append(feature_dict)
+    
+    # Score all candidates at once, then rank and explain only the few
+    # that can be returned or queued for review
+    scored_candidates = []
+    
+    if candidates:
+        probabilities = np.zeros(len(candidates))
+        if feature_vectors:
+            X = np.vstack(feature_vectors)
+            probabilities[scored_rows] = classifier.predict_proba_batch(X)
         
-        # Get probability from classifier
-        probability = classifier.predict_proba(features)
+        # Stable, so ties keep candidate order as list.sort did
+        top = np.argsort(-probabilities, kind="stable")[:REVIEW_CANDIDATES]
         
-        # Get explanation
-        top_features = classifier.explain(features, top_n=3)
+        # Map candidate index -> row of X for the reachable top candidates
+        feature_row = {i: row for row, i in enumerate(scored_rows)}
+        explained = [i for i in top.tolist() if i in feature_row]
+        explanations = {}
+        if explained:
+            explanations = dict(zip(
+                explained,
+                classifier.explain_batch(
+                    X[[feature_row[i] for i in explained]],
+                    top_n=3
+                )
+            ))
         
-        scored_candidates.append({
-            "payee_id": payee_dict["payee_id"],
-            "name": payee_dict["name_raw"],
-            "bq_supplier_id": payee_dict["bq_supplier_id"],
-            "probability": probability,
-            "features": feature_dict,
-            "top_features": top_features,
-            "sources": candidate.get("sources", [])
-        })
-    
-    # Sort by probability
-    scored_candidates.sort(key=lambda x: x["probability"], reverse=True)
+        for i, probability in zip(top.tolist(), probabilities[top].tolist()):
+            candidate = candidates[i]
+            payee_dict = payee_records[candidate["payee_id"]]
+            scored_candidates.append({
+                "payee_id": payee_dict["payee_id"],
+                "name": payee_dict["name_raw"],
+                "bq_supplier_id": payee_dict["bq_supplier_id"],
+                "probability": probability,
+                "features": feature_dicts[feature_row[i]] if i in feature_row else {},
+                "top_features": explanations.get(i, []),
+                "sources": candidate.get("sources", [])
+            })
     
     # Get best match
     best = scored_candidates[0] if scored_candidates else None
@@ -150,7 +202,7 @@ def _match_one_internal(name_raw: str, db: Session) -> Dict[str, Any]:
     if decision == "needs_review" and settings.rerank_provider == "openai":
         decision, confidence = rerank_with_llm(
             name_raw,
-            scored_candidates[:5]
+            scored_candidates[:RESPONSE_CANDIDATES]
         )
     
     # Build response
@@ -158,7 +210,7 @@ def _match_one_internal(name_raw: str, db: Session) -> Dict[str, Any]:
         "decision": decision,
         "confidence": confidence,
         "matched_payee": None,
-        "candidates": scored_candidates[:5],  # Top 5 candidates
+        "candidates": scored_candidates[:RESPONSE_CANDIDATES],
         "reason": None
     }
     
@@ -173,7 +225,7 @@ def _match_one_internal(name_raw: str, db: Session) -> Dict[str, Any]:
         result["reason"] = f"Borderline match ({confidence:.2%}), review needed"
         
         # Add to review queue
-        add_to_review_queue(name_raw, canon, scored_candidates[:10], db)
+        add_to_review_queue(name_raw, canon, scored_candidates, db)
     else:
         result["reason"] = f"Low confidence ({confidence:.2%})"
     
@@ -184,12 +236,47 @@ def _match_one_internal(name_raw: str, db: Session) -> Dict[str, Any]:
         decision=decision,
         confidence=confidence,
         matched_id=best["payee_id"] if decision == "auto_match" else None,
-        candidate_count=len(scored_candidates)
+        candidate_count=len(candidates)
     )
     
     return result
 
 
+def fetch_payee_records(db: Session, payee_ids: List[int]) -> Dict[int, Dict[str, Any]]:
+    """
+    Fetch payee records for a set of candidates.
+    
+    Records come from the preloaded PAYEE_CACHE; any misses are read
+    with a single query and added to the cache.
+    
+    Returns:
+        Dict mapping payee_id to its record
+    """
+    records = {}
+    missing = []
+    
+    for payee_id in payee_ids:
+        record = PAYEE_CACHE.get(payee_id)
+        if record is None:
+            missing.append(payee_id)
+        else:
+            records[payee_id] = record
+    
+    if missing:
+        ensure_prepared(db, PAYEE_RECORD_STATEMENT, PAYEE_RECORD_PREPARE)
+        result = db.execute(
+            text(f"EXECUTE {PAYEE_RECORD_STATEMENT} (:ids)"),
+            {"ids": missing}
+        ).fetchall()
+        
+        for row in result:
+            record = payee_record(row)
+            PAYEE_CACHE[row[0]] = record
+            records[row[0]] = record
+    
+    return records
+
+
 def add_to_review_queue(
     name_raw: str,
     name_canon: str,
@@ -202,12 +289,12 @@ def add_to_review_queue(
             text("""
                 INSERT INTO review_queue 
                 (q_name_raw, q_name_canon, candidates, status)
-                VALUES (:raw, :canon, :candidates::jsonb, 'open')
-            """),
+                VALUES (:raw, :canon, :candidates, 'open')
+            """).bindparams(bindparam("candidates", type_=JSONB)),
             {
                 "raw": name_raw,
                 "canon": name_canon,
-                "candidates": json.dumps(candidates)
+                "candidates": candidates
             }
         )
         db.commit()
@@ -252,7 +339,7 @@ Respond with JSON: {{"same": true/false, "confidence": 0.0-1.0, "reason": "..."}
             temperature=0.1
         )
         
-        result = json.loads(response.choices[0].message.content)
+        result = orjson.loads(response.choices[0].message.content)
         
         if result.get("same") and result.get("confidence", 0) >= 0.90:
             # LLM is confident they match
@@ -266,6 +353,77 @@ Respond with JSON: {{"same": true/false, "confidence": 0.0-1.0, "reason": "..."}
         return "needs_review", candidates[0]["probability"]
 
 
+def match_chunk(chunk: List[str]) -> List[Dict[str, Any]]:
+    """Match a chunk of names on one session (a batch_process worker)."""
+    # Drop payee records the server process has written since
+    refresh_stale_payee_cache()
+    
+    # Warm the embedding caches for the whole chunk with one batched call
+    if settings.embeddings_provider != "none":
+        try:
+            get_embeddings([canonicalize(name).canon for name in chunk])
+        except Exception as e:
+            logger.error("embedding_prefetch_failed", size=len(chunk), error=str(e))
+    
+    results = []
+    with get_db() as db:
+        for name in chunk:
+            result = match_one(name, db)
+            results.append({
+                "query": name,
+                **result
+            })
+    return results
+
+
+def init_match_process(cache_generation):
+    """
+    Load the feature caches in a freshly started worker process.
+    
+    Args:
+        cache_generation: Shared PAYEE_CACHE invalidation counter
+    """
+    share_payee_cache_generation(cache_generation)
+    
+    with get_db() as db:
+        load_idf_cache(db)
+        load_payee_cache(db)
+
+
+def start_match_pool():
+    """
+    Start the batch matching worker processes.
+    
+    Workers come from a forkserver, never from a fork of the threaded
+    server (a fork could inherit a lock held by another thread), so each
+    loads its own feature caches. Payee cache invalidations in this process
+    reach them through a shared generation counter.
+    """
+    global _match_pool
+    
+    if _match_pool is None:
+        context = multiprocessing.get_context("forkserver")
+        cache_generation = context.Value("Q", 0)
+        share_payee_cache_generation(cache_generation)
+        
+        _match_pool = ProcessPoolExecutor(
+            max_workers=settings.batch_workers,
+            mp_context=context,
+            initializer=init_match_process,
+            initargs=(cache_generation,)
+        )
+        logger.info("match_pool_started", workers=settings.batch_workers)
+
+
+def stop_match_pool():
+    """Shut down the batch matching worker processes."""
+    global _match_pool
+    
+    if _match_pool is not None:
+        _match_pool.shutdown(cancel_futures=True)
+        _match_pool = None
+
+
 def match_batch(
     names: List[str],
     stream: bool = True
@@ -282,26 +440,31 @@ def match_batch(
     """
     logger.info("batch_match_started", count=len(names))
     
-    # Process in chunks with parallelization
-    def process_chunk(chunk):
-        results = []
-        with get_db() as db:
-            for name in chunk:
-                result = match_one(name, db)
-                results.append({
-                    "query": name,
-                    **result
-                })
-        return results
-    
-    # Use batch processing utility
-    results = batch_process(
-        names,
-        process_chunk,
+    # Match each distinct name once
+    unique_names = list(dict.fromkeys(names))
+    
+    # Spread names over all workers so their DB round trips overlap (a
+    # batch smaller than batch_chunk_size would otherwise run on one thread)
+    chunk_size = min(
+        settings.batch_chunk_size,
+        max(1, math.ceil(len(unique_names) / settings.batch_workers))
+    )
+    
+    # Worker processes sidestep the GIL for feature computation; without
+    # a started pool the chunks run on threads
+    unique_results = batch_process(
+        unique_names,
+        match_chunk,
         workers=settings.batch_workers,
-        chunk_size=settings.batch_chunk_size
+        chunk_size=chunk_size,
+        executor=_match_pool
     )
     
+    # Fan results back out to every input position (names whose chunk
+    # failed are left out)
+    by_name = {result["query"]: result for result in unique_results}
+    results = [by_name[name] for name in names if name in by_name]
+    
     logger.info("batch_match_complete", count=len(results))
     
     return results
\ No newline at end of file
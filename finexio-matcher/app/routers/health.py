@@ -1,6 +1,8 @@
 """Health check endpoints."""
 
+import time
 from fastapi import APIRouter
+from sqlalchemy import text
 from app.db import engine
 from app.bigquery_sync import get_supplier_count
 import structlog
@@ -8,17 +10,45 @@ import structlog
 router = APIRouter()
 logger = structlog.get_logger()
 
+# Seconds a supplier count is reused by readiness checks
+SUPPLIER_COUNT_TTL = 10
+
+_count_cache = {"ts": 0.0, "count": 0}
+
+
+def cached_supplier_count() -> int:
+    """
+    Get the supplier count, refreshing it at most every SUPPLIER_COUNT_TTL seconds.
+    
+    Returns:
+        Number of suppliers in the database
+    """
+    now = time.monotonic()
+    if _count_cache["ts"] and now - _count_cache["ts"] < SUPPLIER_COUNT_TTL:
+        return _count_cache["count"]
+    
+    _count_cache["count"] = get_supplier_count()
+    _count_cache["ts"] = now
+    return _count_cache["count"]
+
+
+@router.api_route("/healthz", methods=["GET", "HEAD"])
+def liveness_check():
+    """Liveness probe; never touches the database."""
+    return {"ok": True}
+
 
 @router.get("/health")
-async def health_check():
+@router.get("/readyz")
+def health_check():
     """Basic health check endpoint."""
     try:
         # Check database connection
         with engine.connect() as conn:
-            conn.execute("SELECT 1")
+            conn.execute(text("SELECT 1"))
         
         # Get supplier count
-        supplier_count = get_supplier_count()
+        supplier_count = cached_supplier_count()
         
         return {
             "status": "healthy",
@@ -30,4 +60,4 @@ async def health_check():
         return {
             "status": "unhealthy",
             "error": str(e)
-        }
\ No newline at end of file
+        }
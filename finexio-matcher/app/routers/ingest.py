@@ -2,16 +2,21 @@
 
 import io
 import csv
-from typing import List, Optional
+from functools import lru_cache
+from typing import List, Optional, Tuple
 from fastapi import APIRouter, UploadFile, File, HTTPException, BackgroundTasks
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
 import structlog
+from pgvector import HalfVector
+from psycopg2.extras import execute_values
 
 from app.bigquery_sync import sync_suppliers_from_bigquery
+from app.config import settings
 from app.db import get_db
 from app.canonicalize import canonicalize
-from app.utils import get_embedding
-from sqlalchemy import text
+from app.features import invalidate_payee_cache
+from app.utils import get_embeddings
 
 router = APIRouter()
 logger = structlog.get_logger()
@@ -37,158 +42,201 @@ class BigQuerySyncRequest(BaseModel):
     """Request for BigQuery sync."""
     batch_size: int = 1000
     limit: Optional[int] = None
+    copy_path: bool = False
+
+
+# Columns written by the ingest upsert, in VALUES order
+INGEST_COLUMNS = [
+    "bq_supplier_id", "name_raw", "name_canon", "name_tokens", "dm_codes",
+    "name_vec", "address", "city", "state", "zip_code", "country"
+]
+
+# Rows per multi-VALUES statement
+INGEST_PAGE_SIZE = 1000
+
+# CSV rows parsed and ingested per batch
+INGEST_CSV_BATCH = 5000
+
+
+@lru_cache(maxsize=2)
+def build_ingest_upsert(include_vec: bool) -> Tuple[List[str], str, str]:
+    """
+    Build the execute_values upsert for ingested payees.
+    
+    Returns:
+        Tuple of (columns, SQL with a VALUES %s placeholder, row template)
+    """
+    columns = [c for c in INGEST_COLUMNS if include_vec or c != "name_vec"]
+    
+    template = "(" + ", ".join(
+        "CAST(%s AS halfvec)" if column == "name_vec" else "%s"
+        for column in columns
+    ) + ")"
+    updates = [
+        f"{column} = EXCLUDED.{column}"
+        for column in columns if column != "bq_supplier_id"
+    ]
+    updates.append("updated_at = NOW()")
+    
+    sql = f"""
+        INSERT INTO payees ({', '.join(columns)})
+        VALUES %s
+        ON CONFLICT (bq_supplier_id) DO UPDATE
+        SET {', '.join(updates)}
+        RETURNING payee_id, (xmax = 0) AS inserted
+    """
+    
+    return columns, sql, template
 
 
 @router.post("/ingest")
-async def ingest_payees(request: IngestRequest):
+def ingest_payees(request: IngestRequest):
     """
     Ingest payees into the database.
     
     This endpoint accepts a list of payees and adds them to the network.
+    Payees are upserted on their external ID in multi-row statements; if a
+    statement fails, rows are retried one at a time so only the bad payees
+    are reported in errors. A repeated external ID counts as an update.
     """
-    inserted = 0
-    updated = 0
+    # Canonicalize all names, then embed them in one batched call
+    canon_list = [canonicalize(payee.name) for payee in request.payees]
+    
+    include_vec = settings.embeddings_provider != "none"
+    embeddings = None
+    if include_vec:
+        try:
+            embeddings = get_embeddings([c.canon for c in canon_list])
+        except Exception as e:
+            logger.error("ingest_embeddings_failed", count=len(canon_list), error=str(e))
+            return ingest_failed(request.payees, e)
+    
+    columns, upsert_sql, template = build_ingest_upsert(include_vec)
+    
+    # Later rows with the same external ID replace earlier ones, since
+    # ON CONFLICT cannot touch the same row twice within one statement
+    rows_by_id = {}
+    unkeyed_rows = []
+    superseded = 0
+    for i, (payee, canon_data) in enumerate(zip(request.payees, canon_list)):
+        # A blank external ID means none; '' would conflict on the unique index
+        payee_id = payee.payee_id or None
+        row = {
+            "bq_supplier_id": payee_id,
+            "name_raw": payee.name,
+            "name_canon": canon_data.canon,
+            "name_tokens": list(canon_data.tokens),
+            "dm_codes": list(canon_data.dm_codes),
+            "name_vec": HalfVector(embeddings[i]) if include_vec else None,
+            "address": payee.address,
+            "city": payee.city,
+            "state": payee.state,
+            "zip_code": payee.zip_code,
+            "country": payee.country
+        }
+        entry = (tuple(row[column] for column in columns), payee.name)
+        
+        if payee_id is not None:
+            superseded += payee_id in rows_by_id
+            rows_by_id[payee_id] = entry
+        else:
+            unkeyed_rows.append(entry)
+    
+    entries = list(rows_by_id.values()) + unkeyed_rows
+    if not entries:
+        return {"inserted": 0, "updated": 0, "errors": [], "success": True}
+    
+    rows = [values for values, _ in entries]
     errors = []
     
     with get_db() as db:
-        for payee in request.payees:
-            try:
-                # Canonicalize name
-                canon_data = canonicalize(payee.name)
-                
-                # Get embedding if enabled
-                from app.config import settings
-                embedding = None
-                if settings.embeddings_provider != "none":
-                    embedding = get_embedding(canon_data["canon"])
-                
-                # Check if exists (by external ID if provided)
-                existing = None
-                if payee.payee_id:
-                    existing = db.execute(
-                        text("""
-                            SELECT payee_id 
-                            FROM payees 
-                            WHERE bq_supplier_id = :external_id
-                        """),
-                        {"external_id": payee.payee_id}
-                    ).first()
-                
-                if existing:
-                    # Update existing
-                    params = {
-                        "payee_id": existing[0],
-                        "name_raw": payee.name,
-                        "name_canon": canon_data["canon"],
-                        "name_tokens": canon_data["tokens"],
-                        "dm_codes": canon_data["dm_codes"],
-                        "address": payee.address,
-                        "city": payee.city,
-                        "state": payee.state,
-                        "zip_code": payee.zip_code,
-                        "country": payee.country
-                    }
-                    
-                    if embedding is not None:
-                        params["name_vec"] = f"[{','.join(map(str, embedding.tolist()))}]"
-                        
-                        db.execute(
-                            text("""
-                                UPDATE payees
-                                SET name_raw = :name_raw,
-                                    name_canon = :name_canon,
-                                    name_tokens = :name_tokens,
-                                    dm_codes = :dm_codes,
-                                    name_vec = :name_vec::vector,
-                                    address = :address,
-                                    city = :city,
-                                    state = :state,
-                                    zip_code = :zip_code,
-                                    country = :country,
-                                    updated_at = NOW()
-                                WHERE payee_id = :payee_id
-                            """),
-                            params
-                        )
-                    else:
-                        db.execute(
-                            text("""
-                                UPDATE payees
-                                SET name_raw = :name_raw,
-                                    name_canon = :name_canon,
-                                    name_tokens = :name_tokens,
-                                    dm_codes = :dm_codes,
-                                    address = :address,
-                                    city = :city,
-                                    state = :state,
-                                    zip_code = :zip_code,
-                                    country = :country,
-                                    updated_at = NOW()
-                                WHERE payee_id = :payee_id
-                            """),
-                            params
-                        )
-                    
-                    updated += 1
-                else:
-                    # Insert new
-                    params = {
-                        "bq_supplier_id": payee.payee_id,
-                        "name_raw": payee.name,
-                        "name_canon": canon_data["canon"],
-                        "name_tokens": canon_data["tokens"],
-                        "dm_codes": canon_data["dm_codes"],
-                        "address": payee.address,
-                        "city": payee.city,
-                        "state": payee.state,
-                        "zip_code": payee.zip_code,
-                        "country": payee.country
-                    }
-                    
-                    if embedding is not None:
-                        params["name_vec"] = f"[{','.join(map(str, embedding.tolist()))}]"
-                        
-                        db.execute(
-                            text("""
-                                INSERT INTO payees 
-                                (bq_supplier_id, name_raw, name_canon, name_tokens, dm_codes,
-                                 name_vec, address, city, state, zip_code, country)
-                                VALUES 
-                                (:bq_supplier_id, :name_raw, :name_canon, :name_tokens, :dm_codes,
-                                 :name_vec::vector, :address, :city, :state, :zip_code, :country)
-                            """),
-                            params
-                        )
-                    else:
-                        db.execute(
-                            text("""
-                                INSERT INTO payees 
-                                (bq_supplier_id, name_raw, name_canon, name_tokens, dm_codes,
-                                 address, city, state, zip_code, country)
-                                VALUES 
-                                (:bq_supplier_id, :name_raw, :name_canon, :name_tokens, :dm_codes,
-                                 :address, :city, :state, :zip_code, :country)
-                            """),
-                            params
-                        )
-                    
-                    inserted += 1
-                    
-            except Exception as e:
-                logger.error("payee_ingest_failed", name=payee.name, error=str(e))
-                errors.append({"name": payee.name, "error": str(e)})
-        
-        # Commit all changes
-        db.commit()
+        try:
+            raw_conn = db.connection().connection
+            with raw_conn.cursor() as cur:
+                result = execute_values(
+                    cur,
+                    upsert_sql,
+                    rows,
+                    template=template,
+                    page_size=INGEST_PAGE_SIZE,
+                    fetch=True
+                )
+            
+            # Commit all changes
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            logger.error("payee_ingest_failed", count=len(rows), error=str(e))
+            result, errors = ingest_rows_individually(db, entries, upsert_sql, template)
+    
+    updated_ids = [payee_id for payee_id, was_inserted in result if not was_inserted]
+    invalidate_payee_cache(updated_ids)
     
+    # Earlier occurrences of a repeated external ID were applied and then
+    # updated by the later one
     return {
-        "inserted": inserted,
-        "updated": updated,
+        "inserted": len(result) - len(updated_ids),
+        "updated": len(updated_ids) + superseded,
         "errors": errors,
         "success": len(errors) == 0
     }
 
 
+def ingest_rows_individually(
+    db,
+    entries: List[Tuple[tuple, str]],
+    upsert_sql: str,
+    template: str
+) -> Tuple[list, List[dict]]:
+    """
+    Upsert rows one at a time, each under its own savepoint.
+    
+    Used when a multi-row statement failed, so one bad payee doesn't fail
+    the rest of the request.
+    
+    Args:
+        db: Database session
+        entries: (row values, payee name) pairs
+        upsert_sql: Upsert from build_ingest_upsert
+        template: Row template from build_ingest_upsert
+        
+    Returns:
+        Tuple of (RETURNING rows, per-payee errors)
+    """
+    result = []
+    errors = []
+    
+    for values, name in entries:
+        try:
+            with db.begin_nested():
+                raw_conn = db.connection().connection
+                with raw_conn.cursor() as cur:
+                    result.extend(execute_values(
+                        cur,
+                        upsert_sql,
+                        [values],
+                        template=template,
+                        fetch=True
+                    ))
+        except Exception as e:
+            logger.error("payee_ingest_failed", name=name, error=str(e))
+            errors.append({"name": name, "error": str(e)})
+    
+    db.commit()
+    
+    return result, errors
+
+
+def ingest_failed(payees: List[PayeeInput], error: Exception) -> dict:
+    """Ingest response when the whole request failed."""
+    return {
+        "inserted": 0,
+        "updated": 0,
+        "errors": [{"name": payee.name, "error": str(error)} for payee in payees],
+        "success": False
+    }
+
+
 @router.post("/ingest/csv")
 async def ingest_csv(file: UploadFile = File(...)):
     """
@@ -199,13 +247,33 @@ async def ingest_csv(file: UploadFile = File(...)):
     if not file.filename.endswith('.csv'):
         raise HTTPException(status_code=400, detail="File must be CSV")
     
-    contents = await file.read()
-    csv_reader = csv.DictReader(io.StringIO(contents.decode()))
+    # Parse and ingest on the threadpool, reading the upload in batches
+    return await run_in_threadpool(ingest_csv_stream, file.file)
+
+
+def ingest_csv_stream(binary_file) -> dict:
+    """
+    Ingest a CSV upload in batches of INGEST_CSV_BATCH rows.
+    
+    Only one batch of rows is held in memory at a time.
     
-    payees = []
-    for row in csv_reader:
-        payees.append(PayeeInput(
-            payee_id=row.get('payee_id'),
+    Returns:
+        Ingest response summed over all batches
+    """
+    reader = csv.DictReader(io.TextIOWrapper(binary_file, encoding="utf-8", newline=""))
+    totals = {"inserted": 0, "updated": 0, "errors": [], "success": True}
+    
+    def flush(payees):
+        result = ingest_payees(IngestRequest(payees=payees))
+        totals["inserted"] += result["inserted"]
+        totals["updated"] += result["updated"]
+        totals["errors"].extend(result["errors"])
+        totals["success"] = totals["success"] and result["success"]
+    
+    batch = []
+    for row in reader:
+        batch.append(PayeeInput(
+            payee_id=row.get('payee_id') or None,
             name=row.get('name') or row.get('supplier_name') or row.get('payee_name'),
             address=row.get('address'),
             city=row.get('city'),
@@ -213,9 +281,15 @@ async def ingest_csv(file: UploadFile = File(...)):
             zip_code=row.get('zip_code') or row.get('zip'),
             country=row.get('country')
         ))
+        
+        if len(batch) >= INGEST_CSV_BATCH:
+            flush(batch)
+            batch = []
+    
+    if batch:
+        flush(batch)
     
-    request = IngestRequest(payees=payees)
-    return await ingest_payees(request)
+    return totals
 
 
 @router.post("/sync/bigquery")
@@ -233,11 +307,13 @@ async def sync_bigquery(
     background_tasks.add_task(
         sync_suppliers_from_bigquery,
         batch_size=request.batch_size,
-        limit=request.limit
+        limit=request.limit,
+        copy_path=request.copy_path
     )
     
     return {
         "message": "BigQuery sync started in background",
         "batch_size": request.batch_size,
-        "limit": request.limit
+        "limit": request.limit,
+        "copy_path": request.copy_path
     }
\ No newline at end of file
@@ -1,12 +1,16 @@
 """Matching API endpoints."""
 
+import asyncio
+from collections import Counter
 from typing import List, Optional
 from fastapi import APIRouter, HTTPException
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-import json
+import orjson
 import structlog
 
+from app.config import settings
 from app.matching import match_one, match_batch
 
 router = APIRouter()
@@ -34,7 +38,7 @@ class MatchResponse(BaseModel):
 
 
 @router.post("/", response_model=MatchResponse)
-async def match_single(request: MatchRequest):
+def match_single(request: MatchRequest):
     """
     Match a single payee name.
     
@@ -57,14 +61,35 @@ async def match_batch_endpoint(request: BatchMatchRequest):
     """
     try:
         if request.stream:
-            # Stream results as NDJSON
-            def generate():
-                for name in request.names:
-                    result = match_one(name)
-                    yield json.dumps({
-                        "query": name,
-                        **result
-                    }) + "\n"
+            # Stream results as NDJSON in completion order, matching up to
+            # batch_workers names at once so their DB round trips overlap
+            semaphore = asyncio.Semaphore(settings.batch_workers)
+            
+            async def match_name(name):
+                # A failed name becomes an error record rather than cutting
+                # off a stream whose 200 status is already sent
+                try:
+                    async with semaphore:
+                        result = await run_in_threadpool(match_one, name)
+                except Exception as e:
+                    logger.error("match_failed", name=name, error=str(e))
+                    return {"query": name, "error": str(e)}
+                return {"query": name, **result}
+            
+            # Repeated names are matched once and emitted once per occurrence
+            occurrences = Counter(request.names)
+            
+            async def generate():
+                tasks = [asyncio.create_task(match_name(name)) for name in occurrences]
+                try:
+                    for next_result in asyncio.as_completed(tasks):
+                        result = await next_result
+                        yield (orjson.dumps(result) + b"\n") * occurrences[result["query"]]
+                finally:
+                    # Stop queued names if the client disconnects mid-stream
+                    for task in tasks:
+                        task.cancel()
+                    await asyncio.gather(*tasks, return_exceptions=True)
             
             return StreamingResponse(
                 generate(),
@@ -72,7 +97,7 @@ async def match_batch_endpoint(request: BatchMatchRequest):
             )
         else:
             # Return complete results
-            results = match_batch(request.names, stream=False)
+            results = await run_in_threadpool(match_batch, request.names, stream=False)
             return results
             
     except Exception as e:
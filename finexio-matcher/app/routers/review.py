@@ -2,12 +2,13 @@
 
 from typing import Optional
 from fastapi import APIRouter, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import HTMLResponse
 from fastapi.templating import Jinja2Templates
 from pydantic import BaseModel
-import json
 import structlog
-from sqlalchemy import text
+from sqlalchemy import bindparam, text
+from sqlalchemy.dialects.postgresql import JSONB
 
 from app.config import settings
 from app.db import get_db
@@ -24,6 +25,35 @@ if settings.enable_review_ui:
         templates = Jinja2Templates(directory=template_dir)
 
 
+# Statements used by the review endpoints, built once at import
+OPEN_REVIEWS_SQL = text("""
+    SELECT rq_id, q_name_raw, q_name_canon, candidates, created_at
+    FROM review_queue
+    WHERE status = 'open'
+    ORDER BY created_at DESC
+    LIMIT :limit
+""")
+
+OPEN_REVIEW_SQL = text("""
+    SELECT q_name_raw, q_name_canon, candidates
+    FROM review_queue
+    WHERE rq_id = :id AND status = 'open'
+""")
+
+INSERT_LABEL_SQL = text("""
+    INSERT INTO labels 
+    (q_name_raw, q_name_canon, c_payee_id, y, meta)
+    VALUES (:raw, :canon, :payee_id, :y, :meta)
+""").bindparams(bindparam("meta", type_=JSONB))
+
+CLOSE_REVIEW_SQL = text("""
+    UPDATE review_queue
+    SET status = :status,
+        reviewed_at = NOW()
+    WHERE rq_id = :id
+""")
+
+
 class ReviewDecision(BaseModel):
     """Decision for review item."""
     approved: bool
@@ -32,23 +62,14 @@ class ReviewDecision(BaseModel):
 
 
 @router.get("/open")
-async def get_open_reviews(limit: int = 100):
+def get_open_reviews(limit: int = 100):
     """
     Get open review items.
     
     Returns items that need human review for matching decisions.
     """
     with get_db() as db:
-        result = db.execute(
-            text("""
-                SELECT rq_id, q_name_raw, q_name_canon, candidates, created_at
-                FROM review_queue
-                WHERE status = 'open'
-                ORDER BY created_at DESC
-                LIMIT :limit
-            """),
-            {"limit": limit}
-        ).fetchall()
+        result = db.execute(OPEN_REVIEWS_SQL, {"limit": limit}).fetchall()
         
         items = []
         for row in result:
@@ -56,7 +77,8 @@ async def get_open_reviews(limit: int = 100):
                 "rq_id": row[0],
                 "query_name": row[1],
                 "canonical_name": row[2],
-                "candidates": json.loads(row[3]) if row[3] else [],
+                # jsonb is decoded by the driver (orjson, see app/db.py)
+                "candidates": row[3] or [],
                 "created_at": row[4].isoformat()
             })
         
@@ -67,7 +89,7 @@ async def get_open_reviews(limit: int = 100):
 
 
 @router.post("/{rq_id}/approve")
-async def approve_match(rq_id: int, decision: ReviewDecision):
+def approve_match(rq_id: int, decision: ReviewDecision):
     """
     Approve a match from the review queue.
     
@@ -75,14 +97,7 @@ async def approve_match(rq_id: int, decision: ReviewDecision):
     """
     with get_db() as db:
         # Get review item
-        review = db.execute(
-            text("""
-                SELECT q_name_raw, q_name_canon, candidates
-                FROM review_queue
-                WHERE rq_id = :id AND status = 'open'
-            """),
-            {"id": rq_id}
-        ).first()
+        review = db.execute(OPEN_REVIEW_SQL, {"id": rq_id}).first()
         
         if not review:
             raise HTTPException(status_code=404, detail="Review item not found")
@@ -90,29 +105,18 @@ async def approve_match(rq_id: int, decision: ReviewDecision):
         # Add to labels for training
         if decision.approved and decision.payee_id:
             db.execute(
-                text("""
-                    INSERT INTO labels 
-                    (q_name_raw, q_name_canon, c_payee_id, y, meta)
-                    VALUES (:raw, :canon, :payee_id, true, :meta::jsonb)
-                """),
+                INSERT_LABEL_SQL,
                 {
                     "raw": review[0],
                     "canon": review[1],
                     "payee_id": decision.payee_id,
-                    "meta": json.dumps({"notes": decision.notes})
+                    "y": True,
+                    "meta": {"notes": decision.notes}
                 }
             )
         
         # Update review status
-        db.execute(
-            text("""
-                UPDATE review_queue
-                SET status = 'approved',
-                    reviewed_at = NOW()
-                WHERE rq_id = :id
-            """),
-            {"id": rq_id}
-        )
+        db.execute(CLOSE_REVIEW_SQL, {"status": "approved", "id": rq_id})
         
         db.commit()
         
@@ -122,7 +126,7 @@ async def approve_match(rq_id: int, decision: ReviewDecision):
 
 
 @router.post("/{rq_id}/reject")
-async def reject_match(rq_id: int, decision: ReviewDecision):
+def reject_match(rq_id: int, decision: ReviewDecision):
     """
     Reject a match from the review queue.
     
@@ -130,14 +134,7 @@ async def reject_match(rq_id: int, decision: ReviewDecision):
     """
     with get_db() as db:
         # Get review item
-        review = db.execute(
-            text("""
-                SELECT q_name_raw, q_name_canon, candidates
-                FROM review_queue
-                WHERE rq_id = :id AND status = 'open'
-            """),
-            {"id": rq_id}
-        ).first()
+        review = db.execute(OPEN_REVIEW_SQL, {"id": rq_id}).first()
         
         if not review:
             raise HTTPException(status_code=404, detail="Review item not found")
@@ -145,29 +142,18 @@ async def reject_match(rq_id: int, decision: ReviewDecision):
         # Add negative label for training if a specific payee was rejected
         if decision.payee_id:
             db.execute(
-                text("""
-                    INSERT INTO labels 
-                    (q_name_raw, q_name_canon, c_payee_id, y, meta)
-                    VALUES (:raw, :canon, :payee_id, false, :meta::jsonb)
-                """),
+                INSERT_LABEL_SQL,
                 {
                     "raw": review[0],
                     "canon": review[1],
                     "payee_id": decision.payee_id,
-                    "meta": json.dumps({"notes": decision.notes})
+                    "y": False,
+                    "meta": {"notes": decision.notes}
                 }
             )
         
         # Update review status
-        db.execute(
-            text("""
-                UPDATE review_queue
-                SET status = 'rejected',
-                    reviewed_at = NOW()
-                WHERE rq_id = :id
-            """),
-            {"id": rq_id}
-        )
+        db.execute(CLOSE_REVIEW_SQL, {"status": "rejected", "id": rq_id})
         
         db.commit()
         
@@ -187,7 +173,7 @@ async def review_ui(request: Request):
         return HTMLResponse("Review UI not enabled")
     
     # Get open reviews
-    reviews = await get_open_reviews(limit=50)
+    reviews = await run_in_threadpool(get_open_reviews, limit=50)
     
     return templates.TemplateResponse(
         "review.html",
@@ -9,7 +9,7 @@ CREATE TABLE IF NOT EXISTS payees (
   name_canon     TEXT NOT NULL,
   name_tokens    TEXT[] NOT NULL,
   dm_codes       TEXT[] NOT NULL,     -- double metaphone codes
-  name_vec       VECTOR(1024),        -- dimension configurable
+  name_vec       HALFVEC(1024),       -- half precision, dimension configurable
   
   -- BigQuery source tracking
   bq_supplier_id TEXT,                -- Original BigQuery supplier ID
@@ -30,12 +30,16 @@ CREATE TABLE IF NOT EXISTS payees (
 CREATE INDEX IF NOT EXISTS payees_name_trgm_idx
   ON payees USING GIN (name_canon gin_trgm_ops);
 
--- HNSW for cosine similarity on name_vec (when using embeddings)
+-- HNSW for cosine similarity on name_vec (when using embeddings).
+-- Existing full precision columns are converted by migrate_payees() in db.py.
 CREATE INDEX IF NOT EXISTS payees_name_vec_hnsw
-  ON payees USING hnsw (name_vec vector_cosine_ops);
+  ON payees USING hnsw (name_vec halfvec_cosine_ops)
+  WITH (m = 16, ef_construction = 64);
 
--- Index for BigQuery supplier ID lookups
-CREATE INDEX IF NOT EXISTS payees_bq_supplier_idx
+-- Unique index for BigQuery supplier ID lookups (ON CONFLICT target for upserts).
+-- Duplicates left by the old non-unique index are removed by migrate_payees().
+DROP INDEX IF EXISTS payees_bq_supplier_idx;
+CREATE UNIQUE INDEX IF NOT EXISTS payees_bq_supplier_uidx
   ON payees (bq_supplier_id);
 
 -- Index for phonetic codes
@@ -68,14 +72,20 @@ CREATE TABLE IF NOT EXISTS review_queue (
 -- Cache for embeddings to avoid recomputation
 CREATE TABLE IF NOT EXISTS embedding_cache (
   cache_id     BIGSERIAL PRIMARY KEY,
-  text_hash    TEXT NOT NULL UNIQUE,      -- SHA256 of canonicalized text
+  text_hash    TEXT NOT NULL UNIQUE,      -- BLAKE2b-128 of canonicalized text
   text_canon   TEXT NOT NULL,
-  embedding    VECTOR(1024),
+  embedding    VECTOR(1024),              -- legacy float rows only
+  embedding_i8 BYTEA,                     -- int8 components
+  embedding_scale FLOAT8,                 -- embedding = embedding_i8 * scale
   provider     TEXT NOT NULL,
   model        TEXT NOT NULL,
   created_at   TIMESTAMPTZ NOT NULL DEFAULT NOW()
 );
 
+-- Quantized columns for caches created before they existed
+ALTER TABLE embedding_cache ADD COLUMN IF NOT EXISTS embedding_i8 BYTEA;
+ALTER TABLE embedding_cache ADD COLUMN IF NOT EXISTS embedding_scale FLOAT8;
+
 CREATE INDEX IF NOT EXISTS embedding_cache_hash_idx
   ON embedding_cache (text_hash);
 
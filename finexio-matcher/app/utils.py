@@ -2,27 +2,132 @@
 
 import hashlib
 import json
-from functools import lru_cache
-from typing import Optional, List
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import Any, Optional, List, Dict, Tuple
 import numpy as np
 import structlog
 
 from app.config import settings
 from app.db import get_db
 from sqlalchemy import text
+from pgvector import Vector
 
 logger = structlog.get_logger()
 
-# In-memory LRU cache for embeddings
-@lru_cache(maxsize=10000)
-def _embedding_cache(text_hash: str) -> Optional[np.ndarray]:
-    """In-memory embedding cache."""
-    return None
+# OpenAI accepts up to 2048 inputs per embeddings request
+OPENAI_EMBEDDING_BATCH = 2048
+
+# Concurrent single-text requests when a batch request fails
+OPENAI_EMBEDDING_WORKERS = 16
+
+# In-memory LRU cache for embeddings, keyed by text hash
+EMBEDDING_CACHE_SIZE = 10000
+_embedding_cache: "OrderedDict[str, np.ndarray]" = OrderedDict()
+_embedding_cache_lock = threading.Lock()
+
+
+def get_memory_cached_embedding(text_hash: str) -> Optional[np.ndarray]:
+    """Look up an embedding in the in-memory LRU cache."""
+    with _embedding_cache_lock:
+        embedding = _embedding_cache.get(text_hash)
+        if embedding is not None:
+            _embedding_cache.move_to_end(text_hash)
+        return embedding
+
+
+def memory_cache_embedding(text_hash: str, embedding: np.ndarray):
+    """Store an embedding in the in-memory LRU cache."""
+    with _embedding_cache_lock:
+        _embedding_cache[text_hash] = embedding
+        _embedding_cache.move_to_end(text_hash)
+        if len(_embedding_cache) > EMBEDDING_CACHE_SIZE:
+            _embedding_cache.popitem(last=False)
+
+
+# On-disk embedding cache (LMDB), opened lazily per process
+EMBEDDING_DISK_CACHE_MAP_SIZE = 4 << 30
+_disk_cache = None
+_disk_cache_pid = None
+_disk_cache_lock = threading.Lock()
+
+
+def get_disk_cache():
+    """
+    Get the LMDB environment backing the on-disk embedding cache.
+    
+    Returns:
+        lmdb.Environment, or None if no cache path is configured
+    """
+    global _disk_cache, _disk_cache_pid
+    
+    if not settings.embedding_disk_cache_path:
+        return None
+    
+    with _disk_cache_lock:
+        # LMDB environments must not be shared across fork
+        if _disk_cache is None or _disk_cache_pid != os.getpid():
+            import lmdb
+            _disk_cache = lmdb.open(
+                settings.embedding_disk_cache_path,
+                map_size=EMBEDDING_DISK_CACHE_MAP_SIZE
+            )
+            _disk_cache_pid = os.getpid()
+        return _disk_cache
+
+
+def disk_cache_key(text_hash: str) -> bytes:
+    """Disk cache key; the cache outlives provider/model changes."""
+    return f"{settings.embeddings_provider}:{settings.embedding_model}:{text_hash}".encode()
+
+
+def get_disk_cached_embeddings(text_hashes: List[str]) -> Dict[str, np.ndarray]:
+    """Look up embeddings in the on-disk cache (float32 vectors)."""
+    env = get_disk_cache()
+    if env is None or not text_hashes:
+        return {}
+    
+    found = {}
+    try:
+        with env.begin() as txn:
+            for text_hash in text_hashes:
+                value = txn.get(disk_cache_key(text_hash))
+                if value is not None:
+                    found[text_hash] = np.frombuffer(value, dtype=np.float32)
+    except Exception as e:
+        logger.error("disk_cache_read_failed", error=str(e))
+    
+    return found
+
+
+def disk_cache_embeddings(embeddings: Dict[str, np.ndarray]):
+    """Store embeddings (by text hash) in the on-disk cache."""
+    env = get_disk_cache()
+    if env is None or not embeddings:
+        return
+    
+    try:
+        with env.begin(write=True) as txn:
+            for text_hash, embedding in embeddings.items():
+                txn.put(
+                    disk_cache_key(text_hash),
+                    np.asarray(embedding, dtype=np.float32).tobytes()
+                )
+    except Exception as e:
+        logger.error("disk_cache_write_failed", error=str(e))
 
 
 def get_text_hash(text: str) -> str:
-    """Get SHA256 hash of text for caching."""
-    return hashlib.sha256(text.encode()).hexdigest()
+    """
+    Get a 128-bit BLAKE2b hash of text for caching.
+    
+    The key only has to be stable, not cryptographic. Rows keyed by the old
+    SHA-256 digests (64 hex chars) never collide with these and simply stop
+    being hit.
+    """
+    return hashlib.blake2b(text.encode(), digest_size=16).hexdigest()
 
 
 def get_embedding(text: str) -> np.ndarray:
@@ -41,32 +146,22 @@ def get_embedding(text: str) -> np.ndarray:
     text_hash = get_text_hash(text)
     
     # Check in-memory cache first
-    cached = _embedding_cache(text_hash)
+    cached = get_memory_cached_embedding(text_hash)
     if cached is not None:
         return cached
     
+    # Then the on-disk cache
+    cached = get_disk_cached_embeddings([text_hash]).get(text_hash)
+    if cached is not None:
+        memory_cache_embedding(text_hash, cached)
+        return cached
+    
     # Check database cache
-    with get_db() as db:
-        result = db.execute(
-            text("""
-                SELECT embedding 
-                FROM embedding_cache 
-                WHERE text_hash = :hash
-                  AND provider = :provider
-                  AND model = :model
-            """),
-            {
-                "hash": text_hash,
-                "provider": settings.embeddings_provider,
-                "model": settings.embedding_model
-            }
-        ).first()
-        
-        if result and result[0]:
-            embedding = np.array(result[0])
-            _embedding_cache.cache_clear()
-            _embedding_cache.__wrapped__(text_hash, embedding)
-            return embedding
+    cached = get_cached_embeddings([text_hash]).get(text_hash)
+    if cached is not None:
+        memory_cache_embedding(text_hash, cached)
+        disk_cache_embeddings({text_hash: cached})
+        return cached
     
     # Generate new embedding
     if settings.embeddings_provider == "openai":
@@ -77,13 +172,134 @@ def get_embedding(text: str) -> np.ndarray:
     # Cache in database
     cache_embedding(text_hash, text, embedding)
     
-    # Update in-memory cache
-    _embedding_cache.cache_clear()
-    _embedding_cache.__wrapped__(text_hash, embedding)
+    # Update local caches
+    memory_cache_embedding(text_hash, embedding)
+    disk_cache_embeddings({text_hash: embedding})
     
     return embedding
 
 
+def get_embeddings(texts: List[str]) -> np.ndarray:
+    """
+    Get embeddings for many texts at once.
+    
+    Cached vectors are fetched with a single query and only the misses are
+    sent to the provider, in batched requests.
+    
+    Args:
+        texts: Canonicalized texts to embed
+        
+    Returns:
+        Array of shape (len(texts), embedding_dim) in input order
+    """
+    embeddings = np.zeros((len(texts), settings.embedding_dim))
+    
+    hashes = {t: get_text_hash(t) for t in set(texts) if t}
+    if not hashes:
+        return embeddings
+    
+    # Check in-memory cache, then the on-disk and database caches for the rest
+    found = {}
+    for h in hashes.values():
+        cached = get_memory_cached_embedding(h)
+        if cached is not None:
+            found[h] = cached
+    
+    uncached = [h for h in hashes.values() if h not in found]
+    if uncached:
+        from_disk = get_disk_cached_embeddings(uncached)
+        for h, embedding in from_disk.items():
+            memory_cache_embedding(h, embedding)
+        found.update(from_disk)
+    
+    uncached = [h for h in uncached if h not in found]
+    if uncached:
+        from_db = get_cached_embeddings(uncached)
+        for h, embedding in from_db.items():
+            memory_cache_embedding(h, embedding)
+        disk_cache_embeddings(from_db)
+        found.update(from_db)
+    
+    missing = [t for t, h in hashes.items() if h not in found]
+    
+    # Generate new embeddings
+    if missing:
+        generated = generate_embeddings(missing)
+        cache_embeddings(missing, generated, hashes)
+        for t, embedding in zip(missing, generated):
+            memory_cache_embedding(hashes[t], embedding)
+            found[hashes[t]] = embedding
+        disk_cache_embeddings({hashes[t]: found[hashes[t]] for t in missing})
+    
+    for i, t in enumerate(texts):
+        if t:
+            embeddings[i] = found[hashes[t]]
+    
+    return embeddings
+
+
+def get_cached_embeddings(text_hashes: List[str]) -> Dict[str, np.ndarray]:
+    """Fetch cached embeddings for many hashes in one query."""
+    try:
+        with get_db() as db:
+            result = db.execute(
+                text("""
+                    SELECT text_hash, embedding_i8, embedding_scale, embedding
+                    FROM embedding_cache
+                    WHERE text_hash = ANY(:hashes)
+                      AND provider = :provider
+                      AND model = :model
+                """),
+                {
+                    "hashes": text_hashes,
+                    "provider": settings.embeddings_provider,
+                    "model": settings.embedding_model
+                }
+            ).fetchall()
+        
+        found = {}
+        for text_hash, embedding_i8, scale, embedding in result:
+            if embedding_i8 is not None:
+                found[text_hash] = dequantize_embedding(embedding_i8, scale)
+            elif embedding is not None:
+                found[text_hash] = to_array(embedding)
+        
+        return found
+        
+    except Exception as e:
+        logger.error("cached_embeddings_failed", error=str(e))
+        return {}
+
+
+def generate_embeddings(texts: List[str]) -> List[np.ndarray]:
+    """Generate embeddings with the configured provider, batching API calls."""
+    if settings.embeddings_provider != "openai" or not settings.openai_api_key:
+        if settings.embeddings_provider == "openai":
+            logger.warning("openai_key_missing", fallback="local")
+        return list(get_local_embeddings(texts))
+    
+    import openai
+    client = openai.OpenAI(api_key=settings.openai_api_key)
+    
+    embeddings = []
+    for i in range(0, len(texts), OPENAI_EMBEDDING_BATCH):
+        chunk = texts[i:i + OPENAI_EMBEDDING_BATCH]
+        try:
+            response = client.embeddings.create(
+                model=settings.embedding_model,
+                input=chunk,
+                dimensions=settings.embedding_dim
+            )
+            embeddings.extend(np.array(item.embedding) for item in response.data)
+        except Exception as e:
+            logger.error("openai_batch_embedding_failed", size=len(chunk), error=str(e))
+            # Fall back to one request per text, overlapping their latency
+            with ThreadPoolExecutor(max_workers=OPENAI_EMBEDDING_WORKERS) as executor:
+                embeddings.extend(executor.map(get_openai_embedding, chunk))
+    
+    return embeddings
+
+
 def get_openai_embedding(text: str) -> np.ndarray:
     """Get embedding using OpenAI API."""
     if not settings.openai_api_key:
@@ -113,16 +329,32 @@ def get_local_embedding(text: str) -> np.ndarray:
     Generate local embedding using random projection.
     This is a placeholder for offline development.
     """
-    # Simple hash-based random projection
-    np.random.seed(hash(text) % (2**32))
-    embedding = np.random.randn(settings.embedding_dim)
+    return get_local_embeddings([text])[0]
+
+
+def get_local_embeddings(texts: List[str]) -> np.ndarray:
+    """
+    Generate local embeddings for many texts at once.
     
-    # Normalize to unit vector
-    norm = np.linalg.norm(embedding)
-    if norm > 0:
-        embedding = embedding / norm
+    Each text's vector is expanded from SHAKE-256 of the text (16-bit
+    signed components), so it is the same in every process and does not
+    depend on which batch the text arrives in.
     
-    return embedding
+    Returns:
+        Array of shape (len(texts), embedding_dim) of unit vectors
+    """
+    dim = settings.embedding_dim
+    digest = b"".join(
+        hashlib.shake_256(text.encode()).digest(2 * dim) for text in texts
+    )
+    embeddings = np.frombuffer(digest, dtype=np.int16).reshape(len(texts), dim)
+    embeddings = embeddings.astype(np.float64)
+    
+    # Normalize to unit vectors
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    
+    return embeddings / norms
 
 
 def cache_embedding(text_hash: str, text: str, embedding: np.ndarray):
@@ -132,14 +364,14 @@ def cache_embedding(text_hash: str, text: str, embedding: np.ndarray):
             db.execute(
                 text("""
                     INSERT INTO embedding_cache 
-                    (text_hash, text_canon, embedding, provider, model)
-                    VALUES (:hash, :text, :embedding, :provider, :model)
+                    (text_hash, text_canon, embedding_i8, embedding_scale, provider, model)
+                    VALUES (:hash, :text, :embedding_i8, :embedding_scale, :provider, :model)
                     ON CONFLICT (text_hash) DO NOTHING
                 """),
                 {
                     "hash": text_hash,
                     "text": text,
-                    "embedding": embedding.tolist(),
+                    **quantized_params(embedding),
                     "provider": settings.embeddings_provider,
                     "model": settings.embedding_model
                 }
@@ -149,6 +381,70 @@ def cache_embedding(text_hash: str, text: str, embedding: np.ndarray):
         logger.error("cache_embedding_failed", error=str(e))
 
 
+def cache_embeddings(
+    texts: List[str],
+    embeddings: List[np.ndarray],
+    hashes: Dict[str, str]
+):
+    """Cache many embeddings in database with one executemany."""
+    try:
+        with get_db() as db:
+            db.execute(
+                text("""
+                    INSERT INTO embedding_cache 
+                    (text_hash, text_canon, embedding_i8, embedding_scale, provider, model)
+                    VALUES (:hash, :text, :embedding_i8, :embedding_scale, :provider, :model)
+                    ON CONFLICT (text_hash) DO NOTHING
+                """),
+                [
+                    {
+                        "hash": hashes[t],
+                        "text": t,
+                        **quantized_params(embedding),
+                        "provider": settings.embeddings_provider,
+                        "model": settings.embedding_model
+                    }
+                    for t, embedding in zip(texts, embeddings)
+                ]
+            )
+            db.commit()
+    except Exception as e:
+        logger.error("cache_embeddings_failed", error=str(e))
+
+
+def quantize_embedding(embedding: np.ndarray) -> Tuple[bytes, float]:
+    """
+    Quantize an embedding to int8 with a per-vector scale.
+    
+    Returns:
+        Tuple of (int8 component bytes, scale) with embedding ~= int8 * scale
+    """
+    peak = float(np.max(np.abs(embedding))) if len(embedding) else 0.0
+    scale = peak / 127 if peak > 0 else 1.0
+    return np.round(embedding / scale).astype(np.int8).tobytes(), scale
+
+
+def dequantize_embedding(buf, scale: float) -> np.ndarray:
+    """Rebuild a float32 embedding from quantize_embedding output."""
+    return np.frombuffer(buf, dtype=np.int8).astype(np.float32) * np.float32(scale)
+
+
+def quantized_params(embedding: np.ndarray) -> Dict[str, Any]:
+    """Bind parameters for an embedding_cache row's quantized columns."""
+    embedding_i8, scale = quantize_embedding(embedding)
+    return {"embedding_i8": embedding_i8, "embedding_scale": scale}
+
+
+def to_array(value) -> np.ndarray:
+    """Convert a vector column value to a numpy array."""
+    if isinstance(value, Vector):
+        return value.to_numpy()
+    # Without a pgvector adapter psycopg2 returns vectors as '[...]' text
+    if isinstance(value, str):
+        return np.array(json.loads(value))
+    return np.array(value)
+
+
 def cosine_similarity(vec1: np.ndarray, vec2: np.ndarray) -> float:
     """Calculate cosine similarity between two vectors."""
     if vec1.size == 0 or vec2.size == 0:
@@ -187,28 +483,47 @@ def compute_idf(corpus_tokens: List[List[str]]) -> dict:
     return idf
 
 
-def batch_process(items: List, func, workers: int = 8, chunk_size: int = 100):
-    """Process items in parallel batches."""
-    from concurrent.futures import ThreadPoolExecutor, as_completed
-    import math
+def batch_process(
+    items: List,
+    func,
+    workers: int = 8,
+    chunk_size: int = 100,
+    executor: Optional[Executor] = None
+):
+    """
+    Process items in parallel batches.
     
-    results = []
-    chunks = []
+    Results come back in input order; a chunk that raises is logged and
+    skipped without affecting the others.
     
+    Args:
+        items: Items to process
+        func: Called with each chunk, returns a list of results. Must be a
+            module-level function when executor is a process pool
+        workers: Number of parallel workers
+        chunk_size: Items per chunk
+        executor: Long-lived executor to run chunks on (left running);
+            by default a thread pool is created for this call
+    """
     # Split into chunks
-    for i in range(0, len(items), chunk_size):
-        chunks.append(items[i:i + chunk_size])
+    chunks = [items[i:i + chunk_size] for i in range(0, len(items), chunk_size)]
     
-    # Process chunks in parallel
-    with ThreadPoolExecutor(max_workers=workers) as executor:
-        futures = {executor.submit(func, chunk): i 
-                   for i, chunk in enumerate(chunks)}
-        
-        for future in as_completed(futures):
-            try:
-                result = future.result()
-                results.extend(result)
-            except Exception as e:
-                logger.error("batch_process_error", error=str(e))
+    if executor is None:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            return _collect_chunks(pool, func, chunks)
+    
+    return _collect_chunks(executor, func, chunks)
+
+
+def _collect_chunks(executor: Executor, func, chunks: List) -> List:
+    """Run func over chunks on executor, collecting in submission order."""
+    results = []
+    futures = [executor.submit(func, chunk) for chunk in chunks]
+    
+    for future in futures:
+        try:
+            results.extend(future.result())
+        except Exception as e:
+            logger.error("batch_process_error", error=str(e))
     
     return results
\ No newline at end of file
@@ -1,5 +1,6 @@
 """Main FastAPI application entry point."""
 
+import asyncio
 import os
 import sys
 from contextlib import asynccontextmanager
@@ -14,7 +15,8 @@ sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 from app.config import settings
 from app.db import init_database, check_extensions
-from app.features import load_idf_cache
+from app.features import load_idf_cache, load_payee_cache
+from app.matching import start_match_pool, stop_match_pool
 from app.routers import health, ingest, match, review
 from app.bigquery_sync import get_supplier_count
 
@@ -49,13 +51,19 @@ async def lifespan(app: FastAPI):
     init_database()
     check_extensions()
     
-    # Load IDF cache for features
+    # Load IDF and payee record caches for features and check the supplier
+    # count concurrently, each on its own session
     from app.db import get_db
-    with get_db() as db:
-        load_idf_cache(db)
     
-    # Check supplier count
-    supplier_count = get_supplier_count()
+    def load_with_session(loader):
+        with get_db() as db:
+            loader(db)
+    
+    _, _, supplier_count = await asyncio.gather(
+        asyncio.to_thread(load_with_session, load_idf_cache),
+        asyncio.to_thread(load_with_session, load_payee_cache),
+        asyncio.to_thread(get_supplier_count)
+    )
     logger.info("supplier_count", count=supplier_count)
     
     if supplier_count == 0:
@@ -64,12 +72,16 @@ async def lifespan(app: FastAPI):
             message="Run BigQuery sync to load suppliers"
         )
     
+    if settings.batch_use_processes:
+        start_match_pool()
+    
     logger.info("application_ready")
     
     yield
     
     # Shutdown
     logger.info("application_shutdown")
+    stop_match_pool()
 
 
 # Create FastAPI app
@@ -0,0 +1,86 @@
+"""Company name variations shared by the matcher test scripts."""
+
+from typing import Tuple
+
+# Microsoft variations
+MICROSOFT_TESTS: Tuple[str, ...] = (
+    "Microsoft Corporation",
+    "Microsoft Corp",
+    "Microsoft",
+    "MSFT",
+    "Microsft",  # Typo
+    "Microsoft Inc",
+)
+
+# Home Depot / HD Supply variations
+HD_TESTS: Tuple[str, ...] = (
+    "Home Depot",
+    "The Home Depot",
+    "Home Depot Inc",
+    "HD Supply",
+    "HD Supply Holdings",
+    "HomeDepot",  # No space
+)
+
+# FedEx variations
+FEDEX_TESTS: Tuple[str, ...] = (
+    "FedEx",
+    "Federal Express",
+    "FedEx Corporation",
+    "Fed Ex",  # Space
+    "FEDEX",
+    "FedX",  # Typo
+)
+
+# Mixed batch of 20 company variations
+BATCH_NAMES: Tuple[str, ...] = (
+    "Microsoft", "Apple Computer", "Amazon Web Services", "Google",
+    "Fed Ex", "UPS", "The Home Depot", "HD Supply",
+    "Walmart Stores", "Tesla Motors", "Facebook", "Netflix",
+    "Oracle", "IBM", "Intel Corp", "MSFT", "AAPL", "AMZN", "GOOGL", "WMT",
+)
+
+# Known companies with variations, five per company
+KNOWN_COMPANIES: Tuple[str, ...] = (
+    # Microsoft variations
+    "Microsoft Corporation",
+    "Microsoft Corp",
+    "Microsoft",
+    "MSFT",
+    "Microsoft Inc",
+    
+    # Home Depot variations
+    "Home Depot",
+    "The Home Depot",
+    "Home Depot Inc",
+    "HD Supply",
+    "Home Depot USA",
+    
+    # FedEx variations
+    "FedEx",
+    "Federal Express",
+    "FedEx Corporation",
+    "Fed Ex",
+    "FEDEX CORP",
+    
+    # Apple variations
+    "Apple Inc",
+    "Apple Computer",
+    "Apple",
+    "AAPL",
+    "Apple Inc.",
+    
+    # Amazon variations
+    "Amazon",
+    "Amazon.com",
+    "Amazon Inc",
+    "Amazon Web Services",
+    "AWS",
+    
+    # Google variations
+    "Google",
+    "Google LLC",
+    "Google Inc",
+    "Alphabet Inc",
+    "GOOGL",
+)
@@ -3,101 +3,92 @@
 
 import os
 import sys
-import json
+import orjson
 import time
 import requests
-from typing import List, Dict
-import subprocess
+from requests.adapters import HTTPAdapter
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 
 # Add app to path
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
+from test_fixtures import KNOWN_COMPANIES
+
+# One keep-alive connection pool for every call to the service
+SESSION = requests.Session()
+SESSION.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=16))
+
+# Per-row output is skipped when FINEXIO_TEST_VERBOSE=0; summaries always print
+VERBOSE = os.getenv("FINEXIO_TEST_VERBOSE", "1") == "1"
+
+def vprint(*args, **kwargs):
+    """Print only in verbose mode."""
+    if VERBOSE:
+        print(*args, **kwargs)
+
 def wait_for_service(url: str, timeout: int = 30):
-    """Wait for service to be ready."""
+    """Wait for service to be ready, polling with HEAD and exponential backoff."""
     print(f"Waiting for service at {url}...")
-    start = time.time()
-    while time.time() - start < timeout:
+    deadline = time.monotonic() + timeout
+    delay = 0.05
+    while time.monotonic() < deadline:
         try:
-            response = requests.get(url)
+            response = SESSION.head(url, timeout=(0.2, 0.5))
             if response.status_code == 200:
                 print("✓ Service is ready!")
                 return True
-        except:
+        except requests.RequestException:
             pass
-        time.sleep(1)
+        time.sleep(delay)
+        delay = min(delay * 1.7, 0.5)
     return False
 
 def test_known_companies():
     """Test matching with known companies."""
     base_url = "http://localhost:8000"
-    
+
     # Known test companies with variations
-    test_companies = [
-        # Microsoft variations
-        "Microsoft Corporation",
-        "Microsoft Corp",
-        "Microsoft",
-        "MSFT",
-        "Microsoft Inc",
-        
-        # Home Depot variations
-        "Home Depot",
-        "The Home Depot",
-        "Home Depot Inc",
-        "HD Supply",
-        "Home Depot USA",
-        
-        # FedEx variations
-        "FedEx",
-        "Federal Express",
-        "FedEx Corporation",
-        "Fed Ex",
-        "FEDEX CORP",
-        
-        # Apple variations
-        "Apple Inc",
-        "Apple Computer",
-        "Apple",
-        "AAPL",
-        "Apple Inc.",
-        
-        # Amazon variations
-        "Amazon",
-        "Amazon.com",
-        "Amazon Inc",
-        "Amazon Web Services",
-        "AWS",
-        
-        # Google variations
-        "Google",
-        "Google LLC",
-        "Google Inc",
-        "Alphabet Inc",
-        "GOOGL"
-    ]
-    
+    test_companies = KNOWN_COMPANIES
+
     print("\n" + "="*80)
     print("TESTING FINEXIO MATCHER WITH KNOWN COMPANIES")
     print("="*80)
-    
+
     # Test single match endpoint
-    print("\n📋 Testing Single Match Endpoint:")
-    print("-" * 40)
-    
-    for company in test_companies[:10]:  # Test first 10
+    vprint("\n📋 Testing Single Match Endpoint:")
+    vprint("-" * 40)
+
+    def probe(company):
         try:
-            response = requests.post(
+            response = SESSION.post(
                 f"{base_url}/v1/match",
                 json={"name": company},
                 timeout=5
             )
-            
-            if response.status_code == 200:
-                result = response.json()
+            return company, response, None
+        except Exception as e:
+            return company, None, e
+
+    # Fan the probes out; map keeps the rows in list order
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        rows = list(executor.map(probe, test_companies[:10]))  # Test first 10
+
+    # Format once all network I/O is done and write in a single call
+    if VERBOSE:
+        width = max((len(company) for company, _, _ in rows), default=0) + 1
+        lines = []
+        for company, response, error in rows:
+            if error is not None:
+                lines.append(f"❌ {company.ljust(width)} → Error: {str(error)}")
+
+            elif response.status_code == 200:
+                result = orjson.loads(response.content)
                 confidence = result.get("confidence", 0)
                 decision = result.get("decision", "unknown")
                 matched = result.get("matched_payee", {})
-                
+
                 # Color code based on confidence
                 if confidence >= 0.97:
                     status = "✅"
@@ -105,69 +96,77 @@ def test_known_companies():
                     status = "🟡"
                 else:
                     status = "❌"
-                
-                print(f"{status} {company:30} → {decision:12} ({confidence:.1%})")
-                
+
+                lines.append(f"{status} {company.ljust(width)} → {decision:12} ({confidence:.1%})")
+
                 if matched:
-                    print(f"   Matched to: {matched.get('name', 'Unknown')}")
-                    
+                    lines.append(f"   Matched to: {matched.get('name', 'Unknown')}")
+
             else:
-                print(f"❌ {company:30} → Error: {response.status_code}")
-                
-        except Exception as e:
-            print(f"❌ {company:30} → Error: {str(e)}")
-    
+                lines.append(f"❌ {company.ljust(width)} → Error: {response.status_code}")
+
+        sys.stdout.write("\n".join(lines) + "\n")
+
     # Test batch match endpoint
     print("\n📋 Testing Batch Match Endpoint:")
     print("-" * 40)
-    
+
     try:
-        response = requests.post(
+        response = SESSION.post(
             f"{base_url}/v1/match/batch",
             json={
                 "names": test_companies,
-                "stream": False
+                "stream": True
             },
-            timeout=30
+            timeout=30,
+            stream=True
         )
-        
+
         if response.status_code == 200:
-            results = response.json()
-            
-            # Summarize results
-            auto_matches = sum(1 for r in results if r.get("decision") == "auto_match")
-            reviews = sum(1 for r in results if r.get("decision") == "needs_review")
-            no_matches = sum(1 for r in results if r.get("decision") == "no_match")
-            
+            # Tally NDJSON lines as they arrive instead of buffering the body
+            counts = Counter()
+            high_confidence = []
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                result = orjson.loads(line)
+                counts[result.get("decision")] += 1
+                if VERBOSE and result.get("confidence", 0) >= 0.97:
+                    high_confidence.append(result)
+
+            total = sum(counts.values())
+            auto_matches = counts["auto_match"]
+            reviews = counts["needs_review"]
+            no_matches = counts["no_match"]
+
             print(f"\n📊 Batch Results Summary:")
-            print(f"   Total tested: {len(results)}")
+            print(f"   Total tested: {total}")
             print(f"   ✅ Auto-matches: {auto_matches}")
             print(f"   🟡 Need review: {reviews}")
             print(f"   ❌ No matches: {no_matches}")
-            
+
             # Show high-confidence matches
-            print(f"\n🎯 High Confidence Matches (≥97%):")
-            for result in results:
-                if result.get("confidence", 0) >= 0.97:
-                    query = result.get("query", "Unknown")
-                    matched = result.get("matched_payee", {})
-                    confidence = result.get("confidence", 0)
-                    print(f"   {query:30} → {matched.get('name', 'N/A'):30} ({confidence:.1%})")
-                    
+            vprint(f"\n🎯 High Confidence Matches (≥97%):")
+            for result in high_confidence:
+                query = result.get("query", "Unknown")
+                matched = result.get("matched_payee", {})
+                confidence = result.get("confidence", 0)
+                vprint(f"   {query:30} → {matched.get('name', 'N/A'):30} ({confidence:.1%})")
+
         else:
             print(f"❌ Batch match failed: {response.status_code}")
-            
+
     except Exception as e:
         print(f"❌ Batch match error: {str(e)}")
-    
+
     # Test health endpoint
     print("\n📋 Testing Health Check:")
     print("-" * 40)
-    
+
     try:
-        response = requests.get(f"{base_url}/health")
+        response = SESSION.get(f"{base_url}/health")
         if response.status_code == 200:
-            health = response.json()
+            health = orjson.loads(response.content)
             print(f"   Status: {health.get('status', 'unknown')}")
             print(f"   Database: {health.get('database', 'unknown')}")
             print(f"   Suppliers loaded: {health.get('suppliers', 0):,}")
@@ -175,27 +174,33 @@ def test_known_companies():
             print(f"❌ Health check failed: {response.status_code}")
     except Exception as e:
         print(f"❌ Health check error: {str(e)}")
-    
+
     print("\n" + "="*80)
     print("TEST COMPLETE")
     print("="*80)
 
 if __name__ == "__main__":
     # Check if service is running
-    if not wait_for_service("http://localhost:8000/health", timeout=5):
+    if not wait_for_service("http://localhost:8000/healthz", timeout=5):
         print("⚠️  Service not running. Starting Finexio matcher...")
-        # Start the service
-        process = subprocess.Popen(
-            ["python", "main.py"],
-            cwd=os.path.dirname(os.path.abspath(__file__))
+        # Serve the app from this process instead of spawning an interpreter
+        import uvicorn
+        from main import app
+        
+        server = uvicorn.Server(
+            uvicorn.Config(app, host="127.0.0.1", port=8000, log_level="warning")
         )
+        thread = threading.Thread(target=server.run, daemon=True)
+        thread.start()
         
         # Wait for it to start
-        if wait_for_service("http://localhost:8000/health", timeout=30):
+        if wait_for_service("http://localhost:8000/healthz", timeout=30):
             test_known_companies()
         else:
             print("❌ Failed to start service")
-            process.terminate()
+        
+        server.should_exit = True
+        thread.join(timeout=10)
     else:
         # Service already running
         test_known_companies()
\ No newline at end of file
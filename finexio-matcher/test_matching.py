@@ -1,123 +1,114 @@
 #!/usr/bin/env python3
 """Test matching with variations of known companies."""
 
+import os
+import sys
 import requests
-import json
+import orjson
+from collections import Counter
+from requests.adapters import HTTPAdapter
 
-def test_single_match(name):
-    """Test a single name match."""
-    response = requests.post(
-        "http://localhost:8000/v1/match",
-        json={"name": name}
+from test_fixtures import BATCH_NAMES, FEDEX_TESTS, HD_TESTS, MICROSOFT_TESTS
+
+# One keep-alive connection pool for every call to the service
+SESSION = requests.Session()
+SESSION.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=16))
+
+# Per-row output is skipped when FINEXIO_TEST_VERBOSE=0; summaries always print
+VERBOSE = os.getenv("FINEXIO_TEST_VERBOSE", "1") == "1"
+
+def vprint(*args, **kwargs):
+    """Print only in verbose mode."""
+    if VERBOSE:
+        print(*args, **kwargs)
+
+BASE_URL = "http://localhost:8000"
+
+# Display symbol per match decision
+SYMBOL = {"auto_match": "✅", "needs_review": "🟡", "no_match": "❌"}
+
+def run_group(names):
+    """Match a group of names in one batch request and print each result."""
+    response = SESSION.post(
+        f"{BASE_URL}/v1/match/batch",
+        json={"names": names, "stream": False}
     )
-    if response.status_code == 200:
-        result = response.json()
-        return result
-    return None
+    if response.status_code != 200:
+        print(f"❌ Batch match failed: {response.status_code}")
+        return
+    
+    # Names whose match failed server-side are left out, so key by query
+    by_query = {r.get("query"): r for r in orjson.loads(response.content)}
+    rows = [(test_name, by_query.get(test_name)) for test_name in names]
+    
+    if not VERBOSE:
+        return
+    
+    # Format every row first, then write them in a single call
+    width = max((len(test_name) for test_name in names), default=0) + 1
+    lines = []
+    for test_name, result in rows:
+        if result:
+            confidence = result.get("confidence", 0)
+            decision = result.get("decision", "unknown")
+            matched = result.get("matched_payee", {})
+            
+            symbol = SYMBOL.get(decision, "❌")
+            lines.append(f"{symbol} '{test_name.ljust(width)}' → {decision:12} ({confidence:.1%})")
+            if matched:
+                lines.append(f"   Matched to: {matched.get('name', 'Unknown')}")
+    
+    sys.stdout.write("\n".join(lines) + "\n")
 
 print("=" * 80)
 print("FINEXIO MATCHER - COMPREHENSIVE TESTING")
 print("=" * 80)
 
 # Test variations of Microsoft
-print("\n🔍 Testing Microsoft Variations:")
-print("-" * 40)
-microsoft_tests = [
-    "Microsoft Corporation",
-    "Microsoft Corp",
-    "Microsoft",
-    "MSFT",
-    "Microsft",  # Typo
-    "Microsoft Inc"
-]
-
-for test_name in microsoft_tests:
-    result = test_single_match(test_name)
-    if result:
-        confidence = result.get("confidence", 0)
-        decision = result.get("decision", "unknown")
-        matched = result.get("matched_payee", {})
-        
-        symbol = "✅" if decision == "auto_match" else "🟡" if decision == "needs_review" else "❌"
-        print(f"{symbol} '{test_name:25}' → {decision:12} ({confidence:.1%})")
-        if matched:
-            print(f"   Matched to: {matched.get('name', 'Unknown')}")
+vprint("\n🔍 Testing Microsoft Variations:")
+vprint("-" * 40)
+
+run_group(MICROSOFT_TESTS)
 
 # Test variations of Home Depot / HD Supply
-print("\n🔍 Testing Home Depot / HD Supply Variations:")
-print("-" * 40)
-hd_tests = [
-    "Home Depot",
-    "The Home Depot",
-    "Home Depot Inc",
-    "HD Supply",
-    "HD Supply Holdings",
-    "HomeDepot"  # No space
-]
-
-for test_name in hd_tests:
-    result = test_single_match(test_name)
-    if result:
-        confidence = result.get("confidence", 0)
-        decision = result.get("decision", "unknown")
-        matched = result.get("matched_payee", {})
-        
-        symbol = "✅" if decision == "auto_match" else "🟡" if decision == "needs_review" else "❌"
-        print(f"{symbol} '{test_name:25}' → {decision:12} ({confidence:.1%})")
-        if matched:
-            print(f"   Matched to: {matched.get('name', 'Unknown')}")
+vprint("\n🔍 Testing Home Depot / HD Supply Variations:")
+vprint("-" * 40)
+
+run_group(HD_TESTS)
 
 # Test variations of FedEx
-print("\n🔍 Testing FedEx Variations:")
-print("-" * 40)
-fedex_tests = [
-    "FedEx",
-    "Federal Express",
-    "FedEx Corporation",
-    "Fed Ex",  # Space
-    "FEDEX",
-    "FedX"  # Typo
-]
-
-for test_name in fedex_tests:
-    result = test_single_match(test_name)
-    if result:
-        confidence = result.get("confidence", 0)
-        decision = result.get("decision", "unknown")
-        matched = result.get("matched_payee", {})
-        
-        symbol = "✅" if decision == "auto_match" else "🟡" if decision == "needs_review" else "❌"
-        print(f"{symbol} '{test_name:25}' → {decision:12} ({confidence:.1%})")
-        if matched:
-            print(f"   Matched to: {matched.get('name', 'Unknown')}")
+vprint("\n🔍 Testing FedEx Variations:")
+vprint("-" * 40)
+
+run_group(FEDEX_TESTS)
 
 # Batch test
 print("\n📊 Testing Batch Match with 20 Company Variations:")
 print("-" * 40)
 
-batch_names = [
-    "Microsoft", "Apple Computer", "Amazon Web Services", "Google",
-    "Fed Ex", "UPS", "The Home Depot", "HD Supply",
-    "Walmart Stores", "Tesla Motors", "Facebook", "Netflix",
-    "Oracle", "IBM", "Intel Corp", "MSFT", "AAPL", "AMZN", "GOOGL", "WMT"
-]
-
-response = requests.post(
-    "http://localhost:8000/v1/match/batch",
-    json={"names": batch_names, "stream": False}
+response = SESSION.post(
+    f"{BASE_URL}/v1/match/batch",
+    json={"names": BATCH_NAMES, "stream": True},
+    stream=True
 )
 
 if response.status_code == 200:
-    results = response.json()
-    
-    auto_matches = [r for r in results if r.get("decision") == "auto_match"]
-    reviews = [r for r in results if r.get("decision") == "needs_review"]
-    no_matches = [r for r in results if r.get("decision") == "no_match"]
+    # Tally NDJSON lines as they arrive; only auto-matches are kept for display
+    counts = Counter()
+    auto_matches = []
+    for line in response.iter_lines():
+        if not line:
+            continue
+        r = orjson.loads(line)
+        counts[r.get("decision")] += 1
+        if VERBOSE and r.get("decision") == "auto_match":
+            auto_matches.append(r)
     
+    total = sum(counts.values())
     print(f"\nResults Summary:")
-    print(f"  ✅ Auto-matches: {len(auto_matches)}/{len(results)}")
-    print(f"  🟡 Need review: {len(reviews)}/{len(results)}")
-    print(f"  ❌ No matches: {len(no_matches)}/{len(results)}")
+    print(f"  ✅ Auto-matches: {counts['auto_match']}/{total}")
+    print(f"  🟡 Need review: {counts['needs_review']}/{total}")
+    print(f"  ❌ No matches: {counts['no_match']}/{total}")
     
     if auto_matches:
         print(f"\nHigh Confidence Matches:")
@@ -0,0 +1,69 @@
+"""Tests for the payee ingest endpoints."""
+
+import io
+from contextlib import contextmanager, nullcontext
+from unittest import mock
+
+import pytest
+
+from app.config import settings
+from app.routers import ingest
+
+
+class FakeSession:
+    """Session stand-in; ingest only talks to the raw connection."""
+    
+    def connection(self):
+        return mock.MagicMock()
+    
+    def begin_nested(self):
+        return nullcontext()
+    
+    def commit(self):
+        pass
+    
+    def rollback(self):
+        pass
+
+
+@pytest.fixture
+def written_rows():
+    """Patch the database so every upserted row is recorded and inserted."""
+    rows = []
+    
+    @contextmanager
+    def fake_get_db():
+        yield FakeSession()
+    
+    def fake_execute_values(cur, sql, values, template=None, page_size=None, fetch=False):
+        start = len(rows)
+        rows.extend(values)
+        return [(start + i, True) for i in range(len(values))]
+    
+    with mock.patch.object(ingest, "get_db", fake_get_db), \
+            mock.patch.object(ingest, "execute_values", fake_execute_values), \
+            mock.patch.object(ingest, "invalidate_payee_cache"), \
+            mock.patch.object(settings, "embeddings_provider", "none"):
+        yield rows
+
+
+def test_blank_payee_ids_insert_separately(written_rows):
+    request = ingest.IngestRequest(payees=[
+        {"payee_id": "", "name": "Acme Supply"},
+        {"payee_id": "", "name": "Beta Logistics"},
+    ])
+    
+    result = ingest.ingest_payees(request)
+    
+    assert result["inserted"] == 2
+    assert result["updated"] == 0
+    assert [row[0] for row in written_rows] == [None, None]
+
+
+def test_blank_csv_payee_ids_insert_separately(written_rows):
+    upload = io.BytesIO(b"payee_id,name\n,Acme Supply\n,Beta Logistics\n")
+    
+    result = ingest.ingest_csv_stream(upload)
+    
+    assert result["inserted"] == 2
+    assert [row[0] for row in written_rows] == [None, None]